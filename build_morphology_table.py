@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# Copyright © 2023 Anatoliy Poletaev, Ilya Paramonov, Elena Boychuk. All rights reserved.
+
+import argparse
+import multiprocessing
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from constituency_tree_builder.dependency_io import read_conllu
+from morph_analyzer import analyse_words, init_morphology, write_morphology_table
+
+
+def count_words(sentences):
+    counts = Counter()
+    for _, json_ in sentences:
+        counts.update((word["text"], word["lemma"], word["pos"]) for word in json_)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute pymorphy2 tags of the most frequent words of a corpus")
+    parser.add_argument("input", help="CoNLL-U file, - for standard input")
+    parser.add_argument("output", help="morphology table file")
+    parser.add_argument("--top", type=int, default=100000)
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    with source:
+        counts = count_words(read_conllu(source))
+    keys = [key for key, _ in counts.most_common(args.top)]
+    init_morphology()
+    if args.workers > 1:
+        chunks = [keys[ix:ix + args.chunk_size] for ix in range(0, len(keys), args.chunk_size)]
+        with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("fork")) as executor:
+            tags = [item for chunk_tags in executor.map(analyse_words, chunks) for item in chunk_tags]
+    else:
+        tags = analyse_words(keys)
+    write_morphology_table(args.output, zip(keys, tags))
+    covered = sum(counts[key] for key in keys)
+    print(f"{len(keys)} of {len(counts)} words written, "
+          f"{covered} of {sum(counts.values())} tokens covered", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
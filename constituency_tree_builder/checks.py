@@ -4,7 +4,8 @@ from morph_analyzer import get_tags, has_same_tense, is_geographical_object,\
     has_same_gender, is_plur_number
 import constituency_tree_builder.lists
 from constituency_tree_builder.utils import find_conjunction_parts_between, tokens_list,\
-    not_included_children, all_children, get_full_text, \
+    not_included_children, all_children, get_full_text, short_subtree_text, \
+    has_punctuation_marks, children_bounds, subtree_bounds, \
     split_heterogeneous_conjunction_with_adversative,\
     collect_direct_speech_head_parts
 
@@ -40,9 +41,11 @@ def is_verb_subject(dtree):
 
 
 def is_compound_part(dtree, parent):
+    has_deprel = dtree["deprel"] in constituency_tree_builder.lists._compound_part_deprels
+    if not has_deprel:
+        return False
     if is_divided_subordinative(dtree, parent):
         return False
-    has_deprel = dtree["deprel"] in constituency_tree_builder.lists._compound_part_deprels
     has_subject = False
     for subject_candidate in not_included_children(dtree):
         if is_nominative_subject(subject_candidate, dtree):
@@ -51,27 +54,31 @@ def is_compound_part(dtree, parent):
     return has_deprel and has_subject
 
 
+# Проверки упорядочены по стоимости: сначала дешёвые проверки deprel и pos, которые обычно
+# отвергают кандидата, затем обход поддерева, поиск союзов и морфологический анализ.
+# Результат при этом не меняется: переставлены только проверки без побочных эффектов,
+# а ранний отрицательный ответ даётся лишь тогда, когда итоговое выражение не может быть истинным
 def is_divided_subordinative(dtree, main_dtree=None):
+    has_deprel = dtree["deprel"] in constituency_tree_builder.lists._divided_subordinative_deprels
+    if not has_deprel and dtree["deprel"] not in constituency_tree_builder.lists._compound_part_deprels:
+        return False
     if main_dtree is not None and main_dtree["pos"] == "VERB" \
-            and get_tags(dtree["text"], dtree["lemma"], dtree["pos"])["pos"] == "GRND":
+            and get_tags(dtree["text"], dtree["lemma"], dtree["pos"], dtree.get("feats"))["pos"] == "GRND":
         return False
     if is_subordinated_direct_speech(dtree, main_dtree):
         return False
-    if any(map(lambda x: ' '.join(x) == get_full_text(tokens_list(dtree)), constituency_tree_builder.lists._sustainable_introductions)):
+    if short_subtree_text(dtree, constituency_tree_builder.lists._sustainable_introduction_length) \
+            in constituency_tree_builder.lists._sustainable_introduction_texts:
         return False
     if is_enquoted(dtree):
         return False
     if main_dtree is not None and is_head_of_direct_and_indirect_speech(main_dtree, dtree):
         return False
-    has_deprel, has_subordinative_conj, has_subject, has_another_tenses, has_conditional_particles = False, False, False, False, False
-    has_deprel = dtree["deprel"] in constituency_tree_builder.lists._divided_subordinative_deprels
-    if dtree["deprel"] in constituency_tree_builder.lists._compound_part_deprels or has_deprel:
-        conjunction_parts = find_conjunction_parts_between(dtree, main_dtree)
-        conjunction_text = get_full_text(conjunction_parts)
-        if conjunction_text in constituency_tree_builder.lists._conjunction_types and constituency_tree_builder.lists._conjunction_types[conjunction_text] == "subordinative" \
-                or conjunction_text == "—":
-            has_subordinative_conj = True
-    if main_dtree is not None and (dtree["deprel"] in constituency_tree_builder.lists._compound_part_deprels or has_deprel):
+    if has_deprel:
+        for subject_candidate in not_included_children(dtree):
+            if (subject_candidate["pos"], subject_candidate["deprel"]) in constituency_tree_builder.lists._nominative_subject_pos_deprels:
+                return True
+    if main_dtree is not None:
         has_dtree_condition, has_main_part_condition = False, False
         for child in not_included_children(dtree):
             if child["text"].lower() == "бы":
@@ -81,18 +88,18 @@ def is_divided_subordinative(dtree, main_dtree=None):
             if child["text"].lower() == "бы":
                 has_main_part_condition = True
                 break
-        has_conditional_particles = has_dtree_condition and has_main_part_condition
-    for subject_candidate in not_included_children(dtree):
-        if (subject_candidate["pos"], subject_candidate["deprel"]) in constituency_tree_builder.lists._nominative_subject_pos_deprels:
-            has_subject = True
-            break
-    if main_dtree is not None and main_dtree["pos"] == "VERB" and dtree["pos"] == "VERB":
-        main_tags = get_tags(main_dtree["text"], main_dtree["lemma"], main_dtree["pos"])
-        subordinative_tags = get_tags(dtree["text"], dtree["lemma"], dtree["pos"])
-        has_another_tenses = not has_same_tense(main_tags, subordinative_tags)
-    return has_deprel and (has_subject or has_another_tenses) \
-        or has_subordinative_conj \
-        or has_conditional_particles
+        if has_dtree_condition and has_main_part_condition:
+            return True
+    conjunction_parts = find_conjunction_parts_between(dtree, main_dtree)
+    conjunction_text = get_full_text(conjunction_parts)
+    if conjunction_text in constituency_tree_builder.lists._conjunction_types and constituency_tree_builder.lists._conjunction_types[conjunction_text] == "subordinative" \
+            or conjunction_text == "—":
+        return True
+    if has_deprel and main_dtree is not None and main_dtree["pos"] == "VERB" and dtree["pos"] == "VERB":
+        main_tags = get_tags(main_dtree["text"], main_dtree["lemma"], main_dtree["pos"], main_dtree.get("feats"))
+        subordinative_tags = get_tags(dtree["text"], dtree["lemma"], dtree["pos"], dtree.get("feats"))
+        return not has_same_tense(main_tags, subordinative_tags)
+    return False
 
 
 def is_head_of_direct_speech(dtree):
@@ -106,6 +113,9 @@ def is_head_of_direct_and_indirect_speech(main_dtree, possible_indirect_speech):
 
 
 def is_subordinated_direct_speech(dtree, main_dtree):
+    bounds = children_bounds(dtree)
+    if bounds is None or not has_punctuation_marks(dtree, "quotes", *bounds):
+        return False
     children = not_included_children(dtree, natural_order=True)
     if len(children) < 3 or main_dtree is None:
         return False
@@ -130,7 +140,7 @@ def is_subordinated_direct_speech(dtree, main_dtree):
 def is_subordinative(dtree, parent):
     if is_subordinated_direct_speech(dtree, parent):
         return False
-    tags = get_tags(dtree["text"], dtree["lemma"], dtree["pos"])
+    tags = get_tags(dtree["text"], dtree["lemma"], dtree["pos"], dtree.get("feats"))
     if parent["pos"] in {"NOUN", "VERB"} and tags["pos"] in {"PRTF", "ADJF"}:
         return False
     has_deprel, has_subordinative_conj, has_colon, is_appos, compound_prnoun_part, has_punct_between = False, False, False, False, False, False
@@ -152,18 +162,17 @@ def is_subordinative(dtree, parent):
 
 
 def is_compound_geo_proper_noun_part(dtree, parent):
-    if is_geographical_object(dtree["text"], dtree["lemma"], dtree["pos"]) \
-            and is_geographical_object(parent["text"], parent["lemma"], parent["pos"]):
-        if len(not_included_children(dtree)) > 0 and \
-                not_included_children(dtree)[0]["lemma"] == "—":
-            return True
-    return False
+    children = not_included_children(dtree)
+    if len(children) == 0 or children[0]["lemma"] != "—":
+        return False
+    return is_geographical_object(dtree["text"], dtree["lemma"], dtree["pos"], dtree.get("feats")) \
+        and is_geographical_object(parent["text"], parent["lemma"], parent["pos"], parent.get("feats"))
 
 
 def is_compound_name_proper_noun_part(dtree, parent):
-    if is_enclosed_in_brackets(dtree):
+    if parent["pos"] != "PROPN" or dtree["pos"] != "PROPN":
         return False
-    return parent["pos"] == "PROPN" and dtree["pos"] == "PROPN"
+    return not is_enclosed_in_brackets(dtree)
 
 
 def has_subordinative_conjunction(dtree, only_not_included=True):
@@ -195,20 +204,21 @@ def has_adverbial_specific_preposition(dtree):
 
 
 def is_adverbial_specific_preposition(dtree):
-    if get_full_text(tokens_list(dtree)).lower() in constituency_tree_builder.lists._adverbial_specific_preposition_lemmas:
+    text = short_subtree_text(dtree, constituency_tree_builder.lists._adverbial_specific_preposition_length)
+    if text is not None and text.lower() in constituency_tree_builder.lists._adverbial_specific_preposition_lemmas:
         return True
     return False
 
 
 def is_adverbial_specific_nominative(dtree, parent):
-    tags = get_tags(dtree["text"], dtree["lemma"], dtree["pos"])
     if dtree["lemma"] == "раз":
         for child in not_included_children(dtree):
             if child["lemma"] == "несколько":
                 return True
-    if get_full_text(tokens_list(dtree)) in {"также", "достаточно", "в одночасье", "из ничего"}:
+    if short_subtree_text(dtree, 2) in {"также", "достаточно", "в одночасье", "из ничего"}:
         return True
-    if parent["pos"] == "VERB" and tags["pos"] == "GRND":
+    if parent["pos"] == "VERB" \
+            and get_tags(dtree["text"], dtree["lemma"], dtree["pos"], dtree.get("feats"))["pos"] == "GRND":
         return True
     if dtree["text"] == "втроём":
         return True
@@ -216,36 +226,38 @@ def is_adverbial_specific_nominative(dtree, parent):
         return True
     if dtree["text"] == "%" and not_included_children(dtree) and not_included_children(dtree, natural_order=True)[0]["lemma"] == "на":
         return True
-    has_listed_lemma = dtree["lemma"].lower() in (constituency_tree_builder.lists._adverbial_specific_nominatives_lemmas | constituency_tree_builder.lists._months_names)
-    is_ablative_case = tags["case"] == "ablt" # творительный падеж: "ночью"
-    is_dat_case = tags["case"] == "datv" # дательный падеж: по утрам, по вечерам
-    is_accs_case = tags["case"] in {"accs", "nomn"} # винительный падеж: весь вечер
-                                          # именительный падеж, т.к. иногда неотличим от винительного: за год
-    is_loct_case = tags["case"] == "loct" # предложный падеж: в случае
-    is_loc2_case = tags["case"] == "loc2" # второй предложный падеж: в году
-    has_dat_specific_preposition, has_accs_specific_definition, has_accs_specific_preposition, has_loct_specific_preposition, has_loc2_specific_preposition = False, False, False, False, False
-    for child in not_included_children(dtree):
-        if child["lemma"] in {"по", "с"}:
-            has_dat_specific_preposition = True
-        if child["lemma"] in {"весь", "всё", "этот"}:
-            has_accs_specific_definition = True
-        if child["lemma"] in {"в", "за"}:
-            has_accs_specific_preposition = True
-        if child["lemma"] in {"в"}:
-            has_loct_specific_preposition = True
-        if dtree["lemma"] in {"год", "месяц", "квартал"} and child["lemma"] in {"в", "за"}:
-            has_loc2_specific_preposition = True
-    if has_listed_lemma and \
-        (is_ablative_case or
-         is_dat_case and has_dat_specific_preposition or
-         is_accs_case and (has_accs_specific_definition or has_accs_specific_preposition) or
-         is_loct_case and has_loct_specific_preposition or
-         is_loc2_case and has_loc2_specific_preposition):
-        return True
-    if is_verb_predicate(parent) or is_aux_part_of_compound_nominative_predicate(parent):
-        if dtree["deprel"] == "nummod":
+    has_listed_lemma = dtree["~lemma"] in constituency_tree_builder.lists._adverbial_specific_nominatives_lemmas \
+        or dtree["~lemma"] in constituency_tree_builder.lists._months_names
+    if has_listed_lemma:
+        tags = get_tags(dtree["text"], dtree["lemma"], dtree["pos"], dtree.get("feats"))
+        is_ablative_case = tags["case"] == "ablt" # творительный падеж: "ночью"
+        is_dat_case = tags["case"] == "datv" # дательный падеж: по утрам, по вечерам
+        is_accs_case = tags["case"] in {"accs", "nomn"} # винительный падеж: весь вечер
+                                              # именительный падеж, т.к. иногда неотличим от винительного: за год
+        is_loct_case = tags["case"] == "loct" # предложный падеж: в случае
+        is_loc2_case = tags["case"] == "loc2" # второй предложный падеж: в году
+        has_dat_specific_preposition, has_accs_specific_definition, has_accs_specific_preposition, has_loct_specific_preposition, has_loc2_specific_preposition = False, False, False, False, False
+        for child in not_included_children(dtree):
+            if child["lemma"] in {"по", "с"}:
+                has_dat_specific_preposition = True
+            if child["lemma"] in {"весь", "всё", "этот"}:
+                has_accs_specific_definition = True
+            if child["lemma"] in {"в", "за"}:
+                has_accs_specific_preposition = True
+            if child["lemma"] in {"в"}:
+                has_loct_specific_preposition = True
+            if dtree["lemma"] in {"год", "месяц", "квартал"} and child["lemma"] in {"в", "за"}:
+                has_loc2_specific_preposition = True
+        if is_ablative_case or \
+                is_dat_case and has_dat_specific_preposition or \
+                is_accs_case and (has_accs_specific_definition or has_accs_specific_preposition) or \
+                is_loct_case and has_loct_specific_preposition or \
+                is_loc2_case and has_loc2_specific_preposition:
+            return True
+    if dtree["deprel"] == "nummod":
+        if is_verb_predicate(parent) or is_aux_part_of_compound_nominative_predicate(parent):
             for child in not_included_children(dtree):
-                if child["lemma"].lower() in constituency_tree_builder.lists._months_names:
+                if child["~lemma"] in constituency_tree_builder.lists._months_names:
                     return True
                 if child["text"].lower() == "часов":
                     return True
@@ -257,7 +269,7 @@ def is_verbative_target_adverbial(dtree, parent):
         return False
     has_deprel = dtree["deprel"] == "xcomp"
     parent_is_verb = parent["pos"] == "VERB"
-    tags = get_tags(dtree["text"], dtree["lemma"], dtree["pos"])
+    tags = get_tags(dtree["text"], dtree["lemma"], dtree["pos"], dtree.get("feats"))
     dtree_is_infinitive = tags["pos"] == "INFN"
     return has_deprel and parent_is_verb and dtree_is_infinitive
 
@@ -269,53 +281,61 @@ def is_adverbial_head_as_preposition(dtree):
     if dtree["text"].lower() == "счёт" \
             and not_included_children(dtree) and not_included_children(dtree)[0]["text"].lower() == "за":
         return True
-    if get_full_text(tokens_list(dtree)).lower() == "на этот раз":
+    if (short_subtree_text(dtree, 3) or "").lower() == "на этот раз":
         return True
     return False
 
 
 def is_indirect_object(dtree, parent):
+    if dtree["deprel"] not in constituency_tree_builder.lists._indirect_object_candidate_deprels:
+        return False
     if dtree["lemma"] in {"также", "достаточно", "весьма"}:
         return False
     if dtree["lemma"] == "они" and dtree["text"] == "их" \
             and parent is not None and not is_verbal_noun(parent):
         return False
+    is_foreign = dtree["deprel"] == "flat:foreign"
+    is_advcl = parent is not None and dtree["deprel"] == "advcl"
+    may_have_deprel = dtree["deprel"] in constituency_tree_builder.lists._indirect_object_deprels or \
+        dtree["deprel"] == "nummod:gov" or \
+        dtree["deprel"] == "nsubj" and dtree["lemma"].isupper()
+    if not (is_foreign or is_advcl or may_have_deprel):
+        return False
     if parent is not None and is_direct_object_for_verbal_noun(dtree, parent):
         return False
     if parent is not None \
             and is_aux_part_of_compound_nominative_predicate(parent) \
             and is_main_part_of_compound_nominative_predicate(dtree):
         return False
-    if is_enclosed_in_brackets(dtree) and dtree["deprel"] == "flat:foreign":
+    if is_foreign and is_enclosed_in_brackets(dtree):
         return True
-    if parent is not None and parent["pos"] == "NOUN" and dtree["deprel"] == "flat:foreign":
+    if is_foreign and parent is not None and parent["pos"] == "NOUN":
         return True
-    if parent is not None and dtree["deprel"] == "advcl":
+    if is_advcl:
         conjunctions_tokens = [t["lemma"] for t in find_conjunction_parts_between(dtree, parent)]
         if conjunctions_tokens == ["как"]:
             return True
-    has_deprel, is_numeric_modifier, is_atomic_part, is_target_adverbial = False, False, False, False
     has_deprel = dtree["deprel"] in constituency_tree_builder.lists._indirect_object_deprels or \
                  dtree["deprel"] == "nummod:gov" and has_preposition(dtree) or \
                  dtree["deprel"] == "nsubj" and dtree["lemma"].isupper() and not is_enquoted(dtree)
+    if not has_deprel:
+        return False
     if parent is not None:
         if parent["pos"] == "NOUN" and dtree["pos"] == "NUM" \
-                and has_same_gender(get_tags(dtree["text"], dtree["lemma"], dtree["pos"]),
-                                    get_tags(parent["text"], parent["lemma"], parent["pos"])):
-            is_numeric_modifier = True
-    if parent is not None:
-        is_atomic_part = is_atomic_nominative_part(dtree, parent)
-    if parent is not None:
-        is_target_adverbial = is_verbative_target_adverbial(dtree, parent)
-    return has_deprel \
-        and not (is_numeric_modifier or is_atomic_part or is_target_adverbial) \
-        and not has_adverbial_specific_preposition(dtree) \
+                and has_same_gender(get_tags(dtree["text"], dtree["lemma"], dtree["pos"], dtree.get("feats")),
+                                    get_tags(parent["text"], parent["lemma"], parent["pos"], parent.get("feats"))):
+            return False
+        if is_atomic_nominative_part(dtree, parent):
+            return False
+        if is_verbative_target_adverbial(dtree, parent):
+            return False
+    return not has_adverbial_specific_preposition(dtree) \
         and not is_adverbial_specific_nominative(dtree, parent) \
         and not is_adverbial_specific_preposition(dtree)
 
 
 def is_direct_object_for_verbal_noun(dtree, parent):
-    dtree_tags = get_tags(dtree["text"], dtree["lemma"], dtree["pos"])
+    dtree_tags = get_tags(dtree["text"], dtree["lemma"], dtree["pos"], dtree.get("feats"))
     is_in_gent_case = dtree_tags["case"] == "gent" # родительный падеж
     is_parent_verbal_noun = is_verbal_noun(parent)
     return is_parent_verbal_noun and is_in_gent_case
@@ -333,14 +353,12 @@ def is_definition(dtree, parent):
         return False
     if dtree["deprel"] in constituency_tree_builder.lists._definition_deprels:
         return True
-    tags = get_tags(dtree["text"], dtree["lemma"], dtree["pos"])
-    if tags["pos"] in {"PRTF"}:
-        return True
-    if tags["pos"] == "ADJF" and dtree["deprel"] == "acl":
-        return True
     if parent is not None and parent["pos"] == "ADJ" and dtree["lemma"] == "весьма":
         return True
-    return False
+    tags = get_tags(dtree["text"], dtree["lemma"], dtree["pos"], dtree.get("feats"))
+    if tags["pos"] in {"PRTF"}:
+        return True
+    return tags["pos"] == "ADJF" and dtree["deprel"] == "acl"
 
 
 def is_atomic_nominative_part(dtree, parent):
@@ -351,7 +369,7 @@ def is_atomic_nominative_part(dtree, parent):
             if len(not_included_children(dtree)) == 1 and not_included_children(dtree)[0]["lemma"] == "из":
                 return True
     if parent["pos"] == "PRON" and parent["lemma"] == "кто-то":
-        if is_plur_number(dtree["text"], dtree["lemma"], dtree["pos"]):
+        if is_plur_number(dtree["text"], dtree["lemma"], dtree["pos"], dtree.get("feats")):
             if not_included_children(dtree)[0]["lemma"] == "из":
                 return True
     if parent["pos"] == "PROPN" and dtree["pos"] == "PROPN":
@@ -382,7 +400,7 @@ def is_flat_object_part(dtree, parent):
 
 
 def is_flat_object_head(dtree):
-    return dtree["lemma"].lower() in {"множество", "большинство", "кто-то"}
+    return dtree["~lemma"] in {"множество", "большинство", "кто-то"}
 
 
 def is_aux_part_of_compound_verb_predicate(dtree):
@@ -406,7 +424,7 @@ def is_main_part_of_compound_verb_predicate(dtree):
 
 
 def is_aux_verb_text(dtree):
-    if dtree["lemma"].lower() in constituency_tree_builder.lists._aux_verb_specific_lemmas:
+    if dtree["~lemma"] in constituency_tree_builder.lists._aux_verb_specific_lemmas:
         return True
     if dtree["text"] == "смела":
         return True
@@ -423,7 +441,7 @@ def is_main_part_of_compound_nominative_predicate(dtree, parent=None):
         return False
     if parent is not None and dtree["deprel"] == "conj":
         return is_main_part_of_compound_nominative_predicate(parent)
-    tags = get_tags(dtree["text"], dtree["lemma"], dtree["pos"])
+    tags = get_tags(dtree["text"], dtree["lemma"], dtree["pos"], dtree.get("feats"))
     has_pos = dtree["pos"] in constituency_tree_builder.lists._nominative_pos or tags["pos"] == "PRTS"
     is_specific_word = dtree["text"].lower() in {
         "запрещено",
@@ -457,7 +475,7 @@ def is_main_part_of_compound_nominative_predicate(dtree, parent=None):
 
 def is_aux_part_of_compound_nominative_predicate(dtree):
     has_deprel = dtree["deprel"] in constituency_tree_builder.lists._aux_verb_for_nominative_deprels
-    has_special_lemma = dtree["lemma"].lower() in {"становиться", "являться", "стать", "оказаться", "счесть", "быть"}
+    has_special_lemma = dtree["~lemma"] in {"становиться", "являться", "стать", "оказаться", "счесть", "быть"}
     is_a_word = dtree["text"] not in {"—"}
     return (has_deprel or has_special_lemma) and is_a_word
 
@@ -484,7 +502,7 @@ def find_introduction(core_dtree):
         possible_root = candidates[0]
         possible_conjunction = not_included_children(possible_root, natural_order=True)[0]
         has_lemma, has_comma = False, False
-        has_lemma = possible_conjunction["lemma"].lower() in constituency_tree_builder.lists._introduction_conjunction_specific_lemmas
+        has_lemma = possible_conjunction["~lemma"] in constituency_tree_builder.lists._introduction_conjunction_specific_lemmas
         has_comma = "," in {token["lemma"] for token in find_conjunction_parts_between(core_dtree, possible_root)}
         if has_lemma and has_comma:
             return possible_root
@@ -495,11 +513,17 @@ def find_introduction(core_dtree):
     return None
 
 
+# Первый токен поддерева не правее вершины и её потомков, последний не левее, поэтому без
+# открывающей скобки слева и закрывающей справа поддерево можно не обходить
 def is_enclosed_in_brackets(dtree):
-    lemmas = [token["lemma"] for token in tokens_list(dtree)]
-    if len(lemmas) < 2:
+    first_id, last_id = children_bounds(dtree) or (dtree["id"], dtree["id"])
+    if not has_punctuation_marks(dtree, "opening_brackets", last_id=min(first_id, dtree["id"])) \
+            or not has_punctuation_marks(dtree, "closing_brackets", first_id=max(last_id, dtree["id"])):
+        return False
+    first, last, count = subtree_bounds(dtree)
+    if count < 2:
         return False
-    return lemmas[0] in constituency_tree_builder.lists._opening_brackets and lemmas[-1] in constituency_tree_builder.lists._closing_brackets
+    return first["lemma"] in constituency_tree_builder.lists._opening_brackets and last["lemma"] in constituency_tree_builder.lists._closing_brackets
 
 
 def is_enclosed_in_commas(dtree):
@@ -561,25 +585,33 @@ def is_homogeneous_nominative_part(dtree, parent=None):
 
 
 def has_preposition(dtree):
+    return find_preposition(dtree) is not None
+
+
+def find_preposition(dtree):
     for preposition_candidate in not_included_children(dtree):
         if is_preposition(preposition_candidate):
-            return True
-    return False
+            return preposition_candidate
+    return None
 
 
 def is_preposition(dtree):
     if dtree["deprel"] in constituency_tree_builder.lists._preposition_deprels:
         return True
-    if dtree["lemma"].lower() in constituency_tree_builder.lists._preposition_specific_lemmas:
+    if dtree["~lemma"] in constituency_tree_builder.lists._preposition_specific_lemmas:
         return True
     return False
 
 
 def has_indirect_object(dtree):
+    return find_indirect_object(dtree) is not None
+
+
+def find_indirect_object(dtree):
     for indirect_object_candidate in reversed(not_included_children(dtree)):
         if is_indirect_object(indirect_object_candidate, dtree):
-            return True
-    return False
+            return indirect_object_candidate
+    return None
 
 
 def has_coordinative_conjunction(dtree):
@@ -591,6 +623,13 @@ def has_coordinative_conjunction(dtree):
 
 
 def is_enquoted(dtree):
+    bounds = children_bounds(dtree)
+    if bounds is None:
+        return False
+    first_id, last_id = bounds
+    if not has_punctuation_marks(dtree, "opening_quotes", first_id, first_id) \
+            or not has_punctuation_marks(dtree, "closing_quotes", last_id, last_id):
+        return False
     children = not_included_children(dtree, natural_order=True)
     if len(children) < 2:
         return False
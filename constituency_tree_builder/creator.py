@@ -1,10 +1,11 @@
 # Copyright © 2023 Anatoliy Poletaev, Ilya Paramonov, Elena Boychuk. All rights reserved.
 
+from copy import deepcopy
 from functools import reduce
 
 from constituency_tree_builder.checks import is_predicate, is_verb_predicate, is_verb_subject, \
     is_compound_part, \
-    is_divided_subordinative, is_head_of_direct_speech, \
+    is_divided_subordinative, \
     is_subordinated_direct_speech, is_subordinative, is_adverbial, \
     has_adverbial_specific_preposition, is_adverbial_specific_nominative, \
     is_adverbial_head_as_preposition, \
@@ -13,24 +14,83 @@ from constituency_tree_builder.checks import is_predicate, is_verb_predicate, is
     is_flat_object_head, is_aux_part_of_compound_verb_predicate, \
     is_main_part_of_compound_verb_predicate, is_main_verb, \
     is_main_part_of_compound_nominative_predicate, \
-    is_aux_part_of_compound_nominative_predicate, has_introduction, \
+    is_aux_part_of_compound_nominative_predicate, \
     find_introduction, is_enclosed_in_brackets, is_nominative_subject, \
-    has_sustainable_introduction, find_sustainable_introduction, \
+    find_sustainable_introduction, \
     directly_follows, is_particle, is_homogeneous_predicates_part, \
-    is_homogeneous_nominative_part, has_preposition, \
-    is_preposition, has_indirect_object, has_coordinative_conjunction, is_enquoted, \
-    is_heterogeneous_conjunctions_with_adversative, is_punct, \
+    is_homogeneous_nominative_part, has_preposition, find_preposition, \
+    has_coordinative_conjunction, is_enquoted, is_punct, \
     is_proper_noun_definition
 from constituency_tree_builder.utils import find_conjunction_parts_between, tokens_list,\
     not_included_children, split_heterogeneous_conjunction_with_adversative, clean_constituency_tree,\
-    collect_direct_speech_head_parts
+    collect_direct_speech_head_parts, merge_tokens_text, part_key
+from constituency_tree_builder.rules import Rule, compile_rules, apply_rules
+from constituency_tree_builder.execution import builder, execute, BudgetExceeded
 import constituency_tree_builder.lists
 
+# Число предложений, построенных с ограничением работы (budget), и число тех из них, для которых
+# вместо дерева возвращена плоская составляющая: из-за исчерпания ограничения или из-за ошибки.
+# Счётчики ведутся в процессе, который строит деревья; при построении в рабочих процессах
+# родительский процесс подсчитывает их сам по возвращённым деревьям функцией count_conversion
+conversion_stats = {
+    "converted": 0,
+    "budget_exceeded": 0,
+    "failed": 0
+}
 
-def dependency_tree_to_constituency_tree(dependency_tree):
-    return clean_constituency_tree(create_sentence(dependency_tree))
 
+def dependency_tree_to_constituency_tree(dependency_tree, iterative=True, cache=None, group_format="keys",
+                                         budget=None):
+    if group_format not in {"keys", "list"}:
+        raise ValueError(f"Unknown group format: {group_format}")
+    if budget is None:
+        return clean_constituency_tree(execute(create_sentence.steps(dependency_tree), iterative, cache),
+                                       group_format)
+    # Построители изменяют токены, поэтому токены для запасного дерева копируются заранее
+    tokens = fallback_tokens(dependency_tree)
+    try:
+        ctree = clean_constituency_tree(execute(create_sentence.steps(dependency_tree), iterative, cache, budget),
+                                        group_format)
+    except BudgetExceeded as e:
+        ctree = create_fallback(tokens, str(e), "budget_exceeded")
+    except Exception as e:
+        ctree = create_fallback(tokens, repr(e), "failed")
+    count_conversion(conversion_stats, ctree)
+    return ctree
 
+
+def count_conversion(stats, ctree):
+    stats["converted"] += 1
+    if ctree["_type"] == "fallback":
+        stats[ctree["_reason"]] += 1
+
+
+def fallback_tokens(dtree):
+    tokens, nodes, visited = [], [dtree], set()
+    while nodes:
+        node = nodes.pop()
+        if id(node) in visited:
+            continue
+        visited.add(id(node))
+        tokens.append(node)
+        nodes.extend(node["~children"])
+    tokens.sort(key=lambda x: x["id"])
+    return [deepcopy({key: value for key, value in token.items()
+                      if not (key.startswith("~") or key in {"head_id", "id"})}) for token in tokens]
+
+
+# Плоская составляющая, которая возвращается вместо дерева: токены предложения по порядку
+# в списке "parts", причина ("budget_exceeded" или "failed") в "_reason" и её описание в "_error"
+def create_fallback(tokens, error, reason):
+    return {
+        "_type": "fallback",
+        "_reason": reason,
+        "_error": error,
+        "parts": [{"_type": "word", "_token": token} for token in tokens]
+    }
+
+
+@builder
 def create_sentence(dtree):
     children = not_included_children(dtree, natural_order=True)
     end_puncts = []
@@ -40,12 +100,12 @@ def create_sentence(dtree):
         end_puncts.insert(0, child)
         child["~included"] = True
     if not end_puncts:
-        return create_core(dtree)
+        return (yield create_core, dtree)
     endpunct = children[-1]
     endpunct["text"] = ''.join([p["text"] for p in end_puncts])
     return {
         "_type": "sentence",
-        "core": create_core(dtree),
+        "core": (yield create_core, dtree),
         "endpunct": {
             "_type": "endpunct",
             "_token": endpunct
@@ -53,17 +113,18 @@ def create_sentence(dtree):
     }
 
 
+@builder
 def create_core(dtree):
     if is_enclosed_in_brackets(dtree):
         brackets = create_enclosing_brackets(dtree)
         return {
             "_type": "bracketed-group",
-            "content": create_core(dtree),
+            "content": (yield create_core, dtree),
             "brackets": brackets
         }
-    if is_head_of_direct_speech(dtree):
+    indirect_speech, *_, border_tokens = collect_direct_speech_head_parts(dtree)
+    if indirect_speech is not None:
         direct_speech = dtree
-        indirect_speech, *_, border_tokens = collect_direct_speech_head_parts(dtree)
         indirect_speech["head_id"], direct_speech["head_id"] = direct_speech["head_id"], indirect_speech["head_id"]
         indirect_speech["deprel"], direct_speech["deprel"] = direct_speech["deprel"], indirect_speech["deprel"]
         direct_speech["~children"].remove(indirect_speech)
@@ -72,9 +133,9 @@ def create_core(dtree):
             for token in border_tokens:
                 indirect_speech["~children"].remove(token)
                 direct_speech["~children"].append(token)
-        return create_core(indirect_speech)
-    if has_sustainable_introduction(dtree):
-        introduction = find_sustainable_introduction(dtree)
+        return (yield create_core, indirect_speech)
+    introduction = find_sustainable_introduction(dtree)
+    if introduction is not None:
         tokens = tokens_list(dtree)
         main_token = tokens[0]
         for ix, token in enumerate(tokens):
@@ -90,21 +151,21 @@ def create_core(dtree):
             "_token": main_token
         }
         if dtree_is_in_introduction:
-            core_node = create_core(not_included_children(dtree)[0])
+            core_node = (yield create_core, not_included_children(dtree)[0])
         else:
-            core_node = create_core(dtree)
+            core_node = (yield create_core, dtree)
         return {
             "_type": "core",
             "introduction": introduction_node,
             "core": core_node
         }
-    if has_introduction(dtree):
-        introduction = find_introduction(dtree)
+    introduction = find_introduction(dtree)
+    if introduction is not None:
         introduction["~included"] = True
         return {
             "_type": "core",
-            "introduction": create_introduction(introduction, parent=dtree),
-            "core": create_core(dtree)
+            "introduction": (yield create_introduction, introduction, dtree),
+            "core": (yield create_core, dtree)
         }
     compound_parts_roots = [dtree]
     for compound_part_candidate in not_included_children(dtree, natural_order=True):
@@ -118,16 +179,16 @@ def create_core(dtree):
         }
         conjunction_parts = find_conjunction_parts_between(*compound_parts_roots)
         if conjunction_parts:
-            if is_heterogeneous_conjunctions_with_adversative(conjunction_parts):
-                first_coordinative, adversative, second_coordinative = split_heterogeneous_conjunction_with_adversative(conjunction_parts)
+            first_coordinative, adversative, second_coordinative = split_heterogeneous_conjunction_with_adversative(conjunction_parts)
+            if first_coordinative is not None:
                 assert len(compound_parts_roots) == 4
                 first_coordinative = create_conjunction(*first_coordinative)
                 second_coordinative = create_conjunction(*second_coordinative)
                 adversative = create_conjunction(*adversative)
-                fourth_core = create_core(compound_parts_roots[3])
-                third_core = create_core(compound_parts_roots[2])
-                second_core = create_core(compound_parts_roots[1])
-                first_core = create_core(compound_parts_roots[0])
+                fourth_core = (yield create_core, compound_parts_roots[3])
+                third_core = (yield create_core, compound_parts_roots[2])
+                second_core = (yield create_core, compound_parts_roots[1])
+                first_core = (yield create_core, compound_parts_roots[0])
                 return {
                     "_type": "compound-sentence",
                     "first-sentence": {
@@ -147,13 +208,13 @@ def create_core(dtree):
             conjunction = create_conjunction(*conjunction_parts)
             result["joined-by"] = conjunction
         for ix, part in enumerate(compound_parts_roots):
-            result[f"{constituency_tree_builder.lists._parts_names[ix]}-sentence"] = create_core(part)
+            result[part_key(ix, "sentence")] = (yield create_core, part)
         return result
     for divided_subordinated_candidate in reversed(not_included_children(dtree)):
         if is_divided_subordinative(divided_subordinated_candidate, dtree):
             subordinated_sentence = divided_subordinated_candidate
             subordinated_sentence["~included"] = True
-            return create_divided_complex_sentence(dtree, subordinated_sentence)
+            return (yield create_divided_complex_sentence, dtree, subordinated_sentence)
     if is_predicate(dtree) or is_aux_part_of_compound_verb_predicate(dtree) or is_aux_part_of_compound_nominative_predicate(dtree):
         predicate = dtree
         predicate["~included"] = True
@@ -165,21 +226,23 @@ def create_core(dtree):
                 subject["~included"] = True
                 return {
                     "_type": "core",
-                    "subject": create_subject(subject),
-                    "predicate": create_predicate(predicate)
+                    "subject": (yield create_subject, subject),
+                    "predicate": (yield create_predicate, predicate)
                 }
-        return create_predicate(predicate)
-    if is_nominative_subject(dtree) and not is_verb_subject(dtree):
+        return (yield create_predicate, predicate)
+    verb_subject = is_verb_subject(dtree)
+    if is_nominative_subject(dtree) and not verb_subject:
         subject = dtree
         subject["~included"] = True
-        return create_subject(subject)
-    if is_verb_subject(dtree):
+        return (yield create_subject, subject)
+    if verb_subject:
         subject = dtree
         subject["~included"] = True
-        return create_verb_subject(subject)
-    return create_verb_subject(dtree)
+        return (yield create_verb_subject, subject)
+    return (yield create_verb_subject, dtree)
 
 
+@builder
 def create_introduction(dtree, parent=None):
     if is_verb_predicate(dtree) and parent is not None:
         conjunction_parts = find_conjunction_parts_between(dtree,
@@ -188,23 +251,21 @@ def create_introduction(dtree, parent=None):
             conjunction = create_conjunction(*conjunction_parts)
             result = {
                 "_type": "introduction-sentence",
-                "sentence": create_sentence(dtree),
+                "sentence": (yield create_sentence, dtree),
                 "joined-by": conjunction
             }
             return result
     for child in not_included_children(dtree):
         if is_punct(child):
             child["~included"] = True
-    if has_preposition(dtree):
-        for preposition_candidate in not_included_children(dtree):
-            if is_preposition(preposition_candidate):
-                preposition = preposition_candidate
-                preposition["~included"] = True
-                return {
-                    "_type": "introduction",
-                    "preposition": create_preposition(preposition),
-                    "introduction": create_introduction(dtree)
-                }
+    preposition = find_preposition(dtree)
+    if preposition is not None:
+        preposition["~included"] = True
+        return {
+            "_type": "introduction",
+            "preposition": (yield create_preposition, preposition),
+            "introduction": (yield create_introduction, dtree)
+        }
     if len(not_included_children(dtree)) != 0:
         parts = [dtree] + not_included_children(dtree)
         parts.sort(key=lambda x: x["id"])
@@ -214,7 +275,7 @@ def create_introduction(dtree, parent=None):
             "_type": "introduction"
         }
         for ix, part in enumerate(parts):
-            result[f"{constituency_tree_builder.lists._parts_names[ix]}-introduction-part"] = create_introduction(part)
+            result[part_key(ix, "introduction-part")] = (yield create_introduction, part)
         return result
     dtree["~included"] = True
     return {
@@ -223,12 +284,13 @@ def create_introduction(dtree, parent=None):
     }
 
 
+@builder
 def create_divided_complex_sentence(main_dtree, subordinated_dtree):
     if is_enclosed_in_brackets(subordinated_dtree):
         return {
             "_type": "divided-complex-sentence",
-            "main-sentence": create_core(main_dtree),
-            "subordinated-sentence": create_core(subordinated_dtree)
+            "main-sentence": (yield create_core, main_dtree),
+            "subordinated-sentence": (yield create_core, subordinated_dtree)
         }
     conjunction_parts = find_conjunction_parts_between(main_dtree, subordinated_dtree)
     if conjunction_parts:
@@ -238,51 +300,21 @@ def create_divided_complex_sentence(main_dtree, subordinated_dtree):
             main_dtree, subordinated_dtree = subordinated_dtree, main_dtree
     result = {
         "_type": "divided-complex-sentence",
-        "main-sentence": create_core(main_dtree),
-        "subordinated-sentence": create_core(subordinated_dtree)
+        "main-sentence": (yield create_core, main_dtree),
+        "subordinated-sentence": (yield create_core, subordinated_dtree)
     }
     if conjunction_parts:
         result["joined-by"] = conjunction
     return result
 
 
+@builder
 def create_verb_subject(dtree):
-    for indirect_object_candidate in not_included_children(dtree):
-        if is_indirect_object(indirect_object_candidate, dtree):
-            indirect_object = indirect_object_candidate
-            indirect_object["~included"] = True
-            return {
-                "_type": "subject",
-                "subject": create_verb_subject(dtree),
-                "object": create_object(indirect_object)
-            }
-    for adverbial_candidate in not_included_children(dtree):
-        if is_adverbial(adverbial_candidate, dtree):
-            adverbial = adverbial_candidate
-            adverbial["~included"] = True
-            return {
-                "_type": "subject",
-                "subject": create_verb_subject(dtree),
-                "adverbial": create_adverbial(adverbial)
-            }
-    for direct_object_candidate in not_included_children(dtree):
-        if direct_object_candidate["deprel"] in constituency_tree_builder.lists._direct_object_deprels:
-            direct_object = direct_object_candidate
-            direct_object["~included"] = True
-            return {
-                "_type": "subject",
-                "subject": create_verb_subject(dtree),
-                "object": create_object(direct_object)
-            }
-    for particle_candidate in reversed(not_included_children(dtree)):
-        if is_particle(particle_candidate):
-            particle = particle_candidate
-            particle["~included"] = True
-            return {
-                "_type": "subject",
-                "subject": create_verb_subject(dtree),
-                "particle": create_particle(particle)
-            }
+    children = not_included_children(dtree)
+    sources = {"children": children, "reversed": list(reversed(children))}
+    result = yield from apply_rules(_verb_subject_rules, dtree, sources)
+    if result is not None:
+        return result
     dtree["~included"] = True
     return {
         "_type": "subject",
@@ -290,14 +322,15 @@ def create_verb_subject(dtree):
     }
 
 
+@builder
 def create_subject(dtree):
-    if has_introduction(dtree):
-        introduction = find_introduction(dtree)
+    introduction = find_introduction(dtree)
+    if introduction is not None:
         introduction["~included"] = True
         return {
             "_type": "subject",
-            "introduction": create_introduction(introduction),
-            "subject": create_subject(dtree)
+            "introduction": (yield create_introduction, introduction),
+            "subject": (yield create_subject, dtree)
         }
     homogeneous_parts = [dtree]
     for homogeneous_candidate in not_included_children(dtree):
@@ -314,73 +347,22 @@ def create_subject(dtree):
             conjunction = create_conjunction(*conjunction_parts)
             result["joined-by"] = conjunction
         for ix, part in enumerate(homogeneous_parts):
-            result[f"{constituency_tree_builder.lists._parts_names[ix]}-subject"] = create_subject(part)
+            result[part_key(ix, "subject")] = (yield create_subject, part)
         return result
     children = list(reversed(not_included_children(dtree)))
     for proper_noun_definition_candidate in children:
         if is_definition(proper_noun_definition_candidate, dtree) and proper_noun_definition_candidate["pos"] == "PROPN":
             children += not_included_children(proper_noun_definition_candidate)
-    for subordinative_candidate in children:
-        if is_subordinative(subordinative_candidate, dtree):
-            subordinative_candidate["~included"] = True
-            subordinative, role = create_subordinative(subordinative_candidate, dtree)
-            result = {
-                "_type": "subject",
-                "subject": create_subject(dtree),
-                role: subordinative
-            }
-            return result
-    for indirect_object_candidate in children:
-        if is_indirect_object(indirect_object_candidate, dtree):
-            object = indirect_object_candidate
-            object["~included"] = True
-            return {
-                "_type": "subject",
-                "subject": create_subject(dtree),
-                "indirect-object": create_object(object)
-            }
-    for definition_candidate in children:
-        if is_definition(definition_candidate, dtree) and not is_proper_noun_definition(definition_candidate, dtree):
-            definition = definition_candidate
-            definition["~included"] = True
-            return {
-                "_type": "subject",
-                "subject": create_subject(dtree),
-                "definition": create_definition(definition)
-            }
-    for direct_object_candidate in children:
-        if is_direct_object(direct_object_candidate, dtree):
-            direct_object = direct_object_candidate
-            direct_object["~included"] = True
-            return {
-                "_type": "subject",
-                "subject": create_subject(dtree),
-                "direct-object": create_object(direct_object)
-            }
-    for proper_noun_definition_candidate in children:
-        if is_proper_noun_definition(proper_noun_definition_candidate, dtree):
-            definition = proper_noun_definition_candidate
-            definition["~included"] = True
-            return {
-                "_type": "subject",
-                "subject": create_subject(dtree),
-                "definition": create_definition(definition)
-            }
-    for particle_candidate in reversed(children):
-        if is_particle(particle_candidate):
-            particle = particle_candidate
-            particle["~included"] = True
-            return {
-                "_type": "subject",
-                "subject": create_subject(dtree),
-                "particle": create_particle(particle)
-            }
+    sources = {"children": children, "reversed": list(reversed(children))}
+    result = yield from apply_rules(_subject_rules, dtree, sources)
+    if result is not None:
+        return result
     dtree = collect_flat_subject_parts(dtree)
     if is_enquoted(dtree):
         quotes = create_enclosing_quotes(dtree)
         return {
                 "_type": "quoted-group",
-                "content": create_subject(dtree),
+                "content": (yield create_subject, dtree),
                 "quotes": quotes
             }
     return {
@@ -389,9 +371,10 @@ def create_subject(dtree):
         }
 
 
+@builder
 def create_predicate(dtree, parent=None):
-    if has_sustainable_introduction(dtree):
-        introduction = find_sustainable_introduction(dtree)
+    introduction = find_sustainable_introduction(dtree)
+    if introduction is not None:
         tokens = tokens_list(dtree)
         main_token = tokens[0]
         for ix, token in enumerate(tokens):
@@ -405,22 +388,23 @@ def create_predicate(dtree, parent=None):
             "_type": "introduction",
             "_token": main_token
         }
-        core_node = create_predicate(dtree)
+        core_node = (yield create_predicate, dtree)
         return {
             "_type": "predicate",
             "introduction": introduction_node,
             "predicate": core_node
         }
     children = not_included_children(dtree)
-    if is_aux_part_of_compound_verb_predicate(dtree):
-        main_part = None
+    is_aux_verb = is_aux_part_of_compound_verb_predicate(dtree)
+    is_aux_nominative = is_aux_part_of_compound_nominative_predicate(dtree)
+    main_part = None
+    if is_aux_verb:
         for main_part_candidate in not_included_children(dtree):
             if is_main_verb(main_part_candidate):
                 main_part = main_part_candidate
                 children += not_included_children(main_part)
                 break
-    elif is_aux_part_of_compound_nominative_predicate(dtree):
-        main_part = None
+    elif is_aux_nominative:
         for main_part_candidate in not_included_children(dtree):
             if is_main_part_of_compound_nominative_predicate(main_part_candidate, dtree):
                 main_part = main_part_candidate
@@ -432,64 +416,57 @@ def create_predicate(dtree, parent=None):
                 aux_part = aux_part_candidate
                 children += not_included_children(aux_part)
                 break
-    if has_introduction(dtree):
-        introduction = find_introduction(dtree)
+    introduction = find_introduction(dtree)
+    if introduction is not None:
         introduction["~included"] = True
         return {
             "_type": "predicate",
-            "introduction": create_introduction(introduction),
-            "predicate": create_predicate(dtree)
+            "introduction": (yield create_introduction, introduction),
+            "predicate": (yield create_predicate, dtree)
         }
-    for subordinative_candidate in children:
-        if is_subordinative(subordinative_candidate, dtree):
-            subordinative_candidate["~included"] = True
-            subordinative, role = create_subordinative(subordinative_candidate, dtree)
-            result = {
-                "_type": "predicate",
-                "predicate": create_predicate(dtree),
-                role: subordinative
-            }
-            return result
-    for direct_speech_candidate in children:
-        if is_subordinated_direct_speech(direct_speech_candidate, dtree):
-            direct_speech_candidate["~included"] = True
-            direct_speech = create_subordinated_direct_speech(direct_speech_candidate, dtree)
-            result = {
-                "_type": "predicate",
-                "predicate": create_predicate(dtree),
-                "indirect-object": direct_speech
-            }
-            return result
+    reversed_children = list(reversed(children))
+    sources = {
+        "children": children,
+        "reversed": reversed_children,
+        "own-reversed": list(reversed(not_included_children(dtree)))
+    }
+    context = {
+        "main_part": main_part,
+        "is_aux_verb": is_aux_verb,
+        "is_aux_nominative": is_aux_nominative,
+        "following": {token["id"]: following for token, following in zip(reversed_children, reversed_children[1:])}
+    }
+    result = yield from apply_rules(_predicate_clause_rules, dtree, sources, context)
+    if result is not None:
+        return result
     homogeneous_parts = [dtree]
     for homogeneous_candidate in not_included_children(dtree):
         if is_homogeneous_predicates_part(homogeneous_candidate, dtree):
             homogeneous_parts.append(homogeneous_candidate)
     if len(homogeneous_parts) > 1:
-        if has_indirect_object(homogeneous_parts[1]):
-            for indirect_object_candidate in reversed(not_included_children(homogeneous_parts[1])):
-                if is_indirect_object(indirect_object_candidate, homogeneous_parts[1]) and has_coordinative_conjunction(homogeneous_parts[1]) \
-                        and not (
-                        is_aux_part_of_compound_verb_predicate(dtree) and is_main_verb(indirect_object_candidate)) \
-                        and not (is_aux_part_of_compound_verb_predicate(homogeneous_parts[1]) and is_main_verb(indirect_object_candidate)) \
-                        and directly_follows(homogeneous_parts[-1], indirect_object_candidate):
-                    indirect_object = indirect_object_candidate
-                    indirect_object["~included"] = True
-                    return {
-                        "_type": "predicate",
-                        "predicate": create_predicate(dtree),
-                        "indirect-object": create_object(indirect_object)
-                    }
+        for indirect_object_candidate in reversed(not_included_children(homogeneous_parts[1])):
+            if is_indirect_object(indirect_object_candidate, homogeneous_parts[1]) and has_coordinative_conjunction(homogeneous_parts[1]) \
+                    and not (is_aux_verb and is_main_verb(indirect_object_candidate)) \
+                    and not (is_aux_part_of_compound_verb_predicate(homogeneous_parts[1]) and is_main_verb(indirect_object_candidate)) \
+                    and directly_follows(homogeneous_parts[-1], indirect_object_candidate):
+                indirect_object = indirect_object_candidate
+                indirect_object["~included"] = True
+                return {
+                    "_type": "predicate",
+                    "predicate": (yield create_predicate, dtree),
+                    "indirect-object": (yield create_object, indirect_object)
+                }
         for adverbial_candidate in reduce(list.__add__, map(not_included_children, homogeneous_parts)):
             if is_adverbial(adverbial_candidate, dtree) and is_adverbial_specific_nominative(adverbial_candidate, dtree) and has_coordinative_conjunction(homogeneous_parts[1]) \
-                    and not (is_aux_part_of_compound_verb_predicate(dtree) and is_main_verb(adverbial_candidate)) \
+                    and not (is_aux_verb and is_main_verb(adverbial_candidate)) \
                     and not (
                     is_aux_part_of_compound_verb_predicate(homogeneous_parts[1]) and is_main_verb(adverbial_candidate)):
                 adverbial = adverbial_candidate
                 adverbial["~included"] = True
                 return {
                     "_type": "predicate",
-                    "predicate": create_predicate(dtree),
-                    "adverbial": create_adverbial(adverbial)
+                    "predicate": (yield create_predicate, dtree),
+                    "adverbial": (yield create_adverbial, adverbial)
                 }
         result = {
             "_type": "homogeneous-predicates"
@@ -501,100 +478,31 @@ def create_predicate(dtree, parent=None):
             conjunction = create_conjunction(*conjunction_parts)
             result["joined-by"] = conjunction
         for ix, part in enumerate(homogeneous_parts):
-            result[f"{constituency_tree_builder.lists._parts_names[ix]}-predicate"] = create_predicate(part, dtree)
+            result[part_key(ix, "predicate")] = (yield create_predicate, part, dtree)
         return result
-    for indirect_object_candidate in reversed(children):
-        if (is_indirect_object(indirect_object_candidate, dtree)
-                or (is_aux_part_of_compound_nominative_predicate(dtree)
-                    and main_part is not None
-                    and is_main_part_of_compound_nominative_predicate(main_part, dtree)
-                    and is_indirect_object(indirect_object_candidate, main_part)
-                    and not is_atomic_nominative_part(indirect_object_candidate, main_part)))\
-            and not (is_aux_part_of_compound_verb_predicate(dtree) and is_main_verb(indirect_object_candidate)) \
-            and not (is_aux_part_of_compound_nominative_predicate(dtree) and indirect_object_candidate == main_part) \
-            and not indirect_object_candidate["pos"] == "ADJ":
-            indirect_object = indirect_object_candidate
-            indirect_object["~included"] = True
-            return {
-                "_type": "predicate",
-                "predicate": create_predicate(dtree),
-                "indirect-object": create_object(indirect_object)
-            }
-    adverbial_candidates = list(reversed(children))
-    for ix, adverbial_candidate in enumerate(adverbial_candidates):
-        if (is_adverbial(adverbial_candidate, dtree) and not is_aux_part_of_compound_nominative_predicate(dtree) \
-            or is_adverbial_specific_nominative(adverbial_candidate, dtree) or has_adverbial_specific_preposition(adverbial_candidate) \
-            or adverbial_candidate["pos"] == "ADV") \
-                and not (is_aux_part_of_compound_nominative_predicate(dtree) and adverbial_candidate["lemma"] == "так"):
-            if not is_adverbial_specific_nominative(adverbial_candidate, dtree) \
-                    and ix != len(adverbial_candidates) - 1 \
-                    and is_adverbial_specific_nominative(adverbial_candidates[ix + 1], dtree):
-                continue
-            adverbial = adverbial_candidate
-            adverbial["~included"] = True
-            return {
-                "_type": "predicate",
-                "predicate": create_predicate(dtree),
-                "adverbial": create_adverbial(adverbial)
-            }
-    if is_main_part_of_compound_nominative_predicate(dtree):
-        for definition_candidate in reversed(not_included_children(dtree)):
-            if is_definition(definition_candidate, dtree):
-                definition = definition_candidate
-                definition["~included"] = True
-                return {
-                    "_type": "predicate",
-                    "predicate": create_predicate(dtree),
-                    "definition": create_definition(definition)
-                }
-    if is_aux_part_of_compound_nominative_predicate(dtree):
-        for definition_candidate in reversed(children):
-            if is_definition(definition_candidate, main_part):
-                definition = definition_candidate
-                definition["~included"] = True
-                return {
-                    "_type": "predicate",
-                    "predicate": create_predicate(dtree),
-                    "definition": create_definition(definition)
-                }
-    for direct_object_candidate in reversed(children):
-        if is_direct_object(direct_object_candidate, dtree):
-            direct_object = direct_object_candidate
-            direct_object["~included"] = True
-            return {
-                "_type": "predicate",
-                "predicate": create_predicate(dtree),
-                "direct-object": create_object(direct_object)
-            }
-    for particle_candidate in reversed(children):
-        if is_particle(particle_candidate):
-            particle = particle_candidate
-            particle["~included"] = True
-            return {
-                "_type": "predicate",
-                "predicate": create_predicate(dtree),
-                "particle": create_particle(particle)
-            }
-    if is_aux_part_of_compound_verb_predicate(dtree):
+    result = yield from apply_rules(_predicate_rules, dtree, sources, context)
+    if result is not None:
+        return result
+    if is_aux_verb:
         for main_part in not_included_children(dtree):
             if is_main_verb(main_part):
                 main_part["~included"] = True
                 dtree["~included"] = True
                 return {
                     "_type": "compound-predicate",
-                    "main-verb": create_predicate(main_part),
-                    "aux-verb": create_predicate(dtree)
+                    "main-verb": (yield create_predicate, main_part),
+                    "aux-verb": (yield create_predicate, dtree)
                 }
     if is_main_part_of_compound_verb_predicate(dtree):
         for aux_part_candidate in not_included_children(dtree):
-            if aux_part_candidate["lemma"].lower() in constituency_tree_builder.lists._aux_verb_specific_lemmas:
+            if aux_part_candidate["~lemma"] in constituency_tree_builder.lists._aux_verb_specific_lemmas:
                 aux_part = aux_part_candidate
                 aux_part["~included"] = True
                 dtree["~included"] = True
                 return {
                     "_type": "compound-predicate",
-                    "main-verb": create_predicate(dtree),
-                    "aux-verb": create_predicate(aux_part)
+                    "main-verb": (yield create_predicate, dtree),
+                    "aux-verb": (yield create_predicate, aux_part)
                 }
     elif is_main_part_of_compound_nominative_predicate(dtree, parent):
         for aux_part_candidate in not_included_children(dtree):
@@ -603,21 +511,21 @@ def create_predicate(dtree, parent=None):
                 dtree["~included"] = True
                 return {
                     "_type": "compound-predicate",
-                    "main-nominative": create_main_nominative(dtree),
-                    "aux-verb": create_predicate(aux_part_candidate)
+                    "main-nominative": (yield create_main_nominative, dtree),
+                    "aux-verb": (yield create_predicate, aux_part_candidate)
                 }
         return {
             "_type": "compound-predicate",
-            "main-nominative": create_main_nominative(dtree)
+            "main-nominative": (yield create_main_nominative, dtree)
         }
-    elif is_aux_part_of_compound_nominative_predicate(dtree):
+    elif is_aux_nominative:
         for main_part in not_included_children(dtree):
             if is_main_part_of_compound_nominative_predicate(main_part, dtree):
                 main_part["~included"] = True
                 return {
                     "_type": "compound-predicate",
-                    "main-nominative": create_main_nominative(main_part),
-                    "aux-verb": create_predicate(dtree)
+                    "main-nominative": (yield create_main_nominative, main_part),
+                    "aux-verb": (yield create_predicate, dtree)
                 }
     dtree["~included"] = True
     return {
@@ -626,6 +534,7 @@ def create_predicate(dtree, parent=None):
     }
 
 
+@builder
 def create_main_nominative(dtree):
     homogeneous_parts = [dtree]
     for homogeneous_candidate in not_included_children(dtree):
@@ -642,49 +551,25 @@ def create_main_nominative(dtree):
             conjunction = create_conjunction(*conjunction_parts)
             result["joined-by"] = conjunction
         for ix, part in enumerate(homogeneous_parts):
-            result[f"{constituency_tree_builder.lists._parts_names[ix]}-main-nominative"] = create_main_nominative(part)
+            result[part_key(ix, "main-nominative")] = (yield create_main_nominative, part)
+        return result
+    children = not_included_children(dtree)
+    sources = {"children": children, "reversed": list(reversed(children))}
+    result = yield from apply_rules(_main_nominative_rules, dtree, sources)
+    if result is not None:
         return result
-    for indirect_object_candidate in reversed(not_included_children(dtree)):
-        if is_indirect_object(indirect_object_candidate, dtree) \
-                and not is_flat_object_part(indirect_object_candidate, dtree) \
-                and not is_flat_object_head(dtree):
-            indirect_object = indirect_object_candidate
-            indirect_object["~included"] = True
-            return {
-                "_type": "main-nominative",
-                "main-nominative": create_main_nominative(dtree),
-                "indirect-object": create_object(indirect_object)
-            }
-    for particle_candidate in reversed(not_included_children(dtree)):
-        if is_particle(particle_candidate) and particle_candidate["lemma"].lower() != "все":
-            particle = particle_candidate
-            particle["~included"] = True
-            return {
-                "_type": "main-nominative",
-                "main-nominative": create_main_nominative(dtree),
-                "particle": create_particle(particle)
-            }
-    for preposition_candidate in not_included_children(dtree):
-        if preposition_candidate["deprel"] in constituency_tree_builder.lists._preposition_deprels:
-            preposition = preposition_candidate
-            preposition["~included"] = True
-            return {
-                "_type": "main-nominative",
-                "main-nominative": create_main_nominative(dtree),
-                "preposition": create_preposition(preposition)
-            }
     flat_parts = [dtree]
     for flat_part in filter(lambda x: is_atomic_nominative_part(x, dtree), not_included_children(dtree)):
         flat_part["~included"] = True
         flat_parts.append(flat_part)
     if len(flat_parts) > 1:
         flat_parts.sort(key=lambda x: x["id"])
-        dtree["text"] = ' '.join([part["text"] for part in flat_parts])
+        merge_tokens_text(dtree, flat_parts)
     if is_enquoted(dtree):
         quotes = create_enclosing_quotes(dtree)
         return {
             "_type": "quoted-group",
-            "content": create_main_nominative(dtree),
+            "content": (yield create_main_nominative, dtree),
             "quotes": quotes
         }
     return {
@@ -693,12 +578,13 @@ def create_main_nominative(dtree):
     }
 
 
+@builder
 def create_object(dtree):
     if is_enquoted(dtree) and is_verb_predicate(dtree):
         quotes = create_enclosing_quotes(dtree)
         return {
             "_type": "quoted-group",
-            "content": create_core(dtree),
+            "content": (yield create_core, dtree),
             "quotes": quotes
         }
     homogeneous_parts = [dtree]
@@ -706,16 +592,14 @@ def create_object(dtree):
         if homogeneous_candidate["deprel"] in constituency_tree_builder.lists._homogeneous_part_deprels:
             homogeneous_parts.append(homogeneous_candidate)
     if len(homogeneous_parts) > 1:
-        if has_preposition(homogeneous_parts[0]) and not any(map(has_preposition, homogeneous_parts[1:])):
-            for preposition_candidate in not_included_children(homogeneous_parts[0]):
-                if is_preposition(preposition_candidate):
-                    preposition = preposition_candidate
-                    preposition["~included"] = True
-                    return {
-                        "_type": "object",
-                        "object": create_object(dtree),
-                        "preposition": create_preposition(preposition)
-                    }
+        preposition = find_preposition(homogeneous_parts[0])
+        if preposition is not None and not any(map(has_preposition, homogeneous_parts[1:])):
+            preposition["~included"] = True
+            return {
+                "_type": "object",
+                "object": (yield create_object, dtree),
+                "preposition": (yield create_preposition, preposition)
+            }
         result = {
             "_type": "homogeneous-objects"
         }
@@ -726,22 +610,22 @@ def create_object(dtree):
             conjunction = create_conjunction(*conjunction_parts)
             result["joined-by"] = conjunction
         for ix, part in enumerate(homogeneous_parts):
-            result[f"{constituency_tree_builder.lists._parts_names[ix]}-object"] = create_object(part)
+            result[part_key(ix, "object")] = (yield create_object, part)
         return result
-    if has_introduction(dtree):
-        introduction = find_introduction(dtree)
+    introduction = find_introduction(dtree)
+    if introduction is not None:
         introduction["~included"] = True
         return {
             "_type": "object",
-            "introduction": create_introduction(introduction),
-            "object": create_object(dtree)
+            "introduction": (yield create_introduction, introduction),
+            "object": (yield create_object, dtree)
         }
     if len(not_included_children(dtree)) > 0 and not_included_children(dtree, natural_order=True)[0]["lemma"] == "как":
         comparative_conjunction = not_included_children(dtree, natural_order=True)[0]
         comparative_conjunction["~included"] = True
         return {
             "_type": "comparative-clause",
-            "object": create_object(dtree),
+            "object": (yield create_object, dtree),
             "joined-by": create_conjunction(comparative_conjunction)
         }
     children = list(reversed(not_included_children(dtree)))
@@ -749,86 +633,22 @@ def create_object(dtree):
         for child in children:
             if child["pos"] == "NUM":
                 children.extend(not_included_children(child))
-    for subordinative_candidate in children:
-        if is_subordinative(subordinative_candidate, dtree):
-            subordinative_candidate["~included"] = True
-            subordinative, role = create_subordinative(subordinative_candidate, dtree)
-            result = {
-                "_type": "object",
-                "object": create_object(dtree),
-                role: subordinative
-            }
-            return result
-    for indirect_object_candidate in children:
-        if is_indirect_object(indirect_object_candidate, dtree) \
-                and not is_flat_object_part(indirect_object_candidate, dtree) \
-                and not is_flat_object_head(dtree):
-            indirect_object = indirect_object_candidate
-            indirect_object["~included"] = True
-            return {
-                "_type": "object",
-                "object": create_object(dtree),
-                "indirect-object": create_object(indirect_object)
-            }
-    for adverbial_candidate in children:
-        if is_adverbial(adverbial_candidate, dtree):
-            adverbial = adverbial_candidate
-            adverbial["~included"] = True
-            return {
-                "_type": "object",
-                "object": create_object(dtree),
-                "adverbial": create_adverbial(adverbial)
-            }
-    for direct_object_candidate in children:
-        if is_direct_object(direct_object_candidate, dtree) \
-                and not is_flat_object_part(direct_object_candidate, dtree):
-            direct_object = direct_object_candidate
-            direct_object["~included"] = True
-            return {
-                "_type": "object",
-                "object": create_object(dtree),
-                "direct-object": create_object(direct_object)
-            }
-    for particle_candidate in children:
-        if is_particle(particle_candidate):
-            particle = particle_candidate
-            particle["~included"] = True
-            return {
-                "_type": "object",
-                "object": create_object(dtree),
-                "particle": create_particle(particle)
-            }
-    for preposition_candidate in children:
-        if preposition_candidate["deprel"] in constituency_tree_builder.lists._preposition_deprels:
-            preposition = preposition_candidate
-            preposition["~included"] = True
-            return {
-                "_type": "object",
-                "object": create_object(dtree),
-                "preposition": create_preposition(preposition)
-            }
-    for definition_candidate in children:
-        if is_definition(definition_candidate, dtree):
-            definition = definition_candidate
-            definition["~included"] = True
-            return {
-                "_type": "object",
-                "object": create_object(dtree),
-                "definition": create_definition(definition)
-            }
+    result = yield from apply_rules(_object_rules, dtree, {"children": children})
+    if result is not None:
+        return result
     dtree = collect_flat_object_parts(dtree)
     if is_enquoted(dtree):
         quotes = create_enclosing_quotes(dtree)
         return {
             "_type": "quoted-group",
-            "content": create_object(dtree),
+            "content": (yield create_object, dtree),
             "quotes": quotes
         }
     if is_enclosed_in_brackets(dtree):
         brackets = create_enclosing_brackets(dtree)
         return {
             "_type": "bracketed-group",
-            "content": create_object(dtree),
+            "content": (yield create_object, dtree),
             "brackets": brackets
         }
     return {
@@ -837,22 +657,21 @@ def create_object(dtree):
     }
 
 
+@builder
 def create_adverbial(dtree):
     homogeneous_parts = [dtree]
     for homogeneous_candidate in not_included_children(dtree):
         if homogeneous_candidate["deprel"] in constituency_tree_builder.lists._homogeneous_part_deprels:
             homogeneous_parts.append(homogeneous_candidate)
     if len(homogeneous_parts) > 1:
-        if has_preposition(homogeneous_parts[0]) and not any(map(has_preposition, homogeneous_parts[1:])):
-            for preposition_candidate in not_included_children(homogeneous_parts[0]):
-                if is_preposition(preposition_candidate):
-                    preposition = preposition_candidate
-                    preposition["~included"] = True
-                    return {
-                        "_type": "adverbial",
-                        "adverbial": create_adverbial(dtree),
-                        "preposition": create_preposition(preposition)
-                    }
+        preposition = find_preposition(homogeneous_parts[0])
+        if preposition is not None and not any(map(has_preposition, homogeneous_parts[1:])):
+            preposition["~included"] = True
+            return {
+                "_type": "adverbial",
+                "adverbial": (yield create_adverbial, dtree),
+                "preposition": (yield create_preposition, preposition)
+            }
         result = {
             "_type": "homogeneous-adverbials"
         }
@@ -863,81 +682,13 @@ def create_adverbial(dtree):
             conjunction = create_conjunction(*conjunction_parts)
             result["joined-by"] = conjunction
         for ix, part in enumerate(homogeneous_parts):
-            result[f"{constituency_tree_builder.lists._parts_names[ix]}-adverbial"] = create_adverbial(part)
+            result[part_key(ix, "adverbial")] = (yield create_adverbial, part)
+        return result
+    children = not_included_children(dtree)
+    sources = {"children": children, "reversed": list(reversed(children))}
+    result = yield from apply_rules(_adverbial_rules, dtree, sources)
+    if result is not None:
         return result
-    for subordinative_candidate in reversed(not_included_children(dtree)):
-        if is_subordinative(subordinative_candidate, dtree):
-            subordinative_candidate["~included"] = True
-            subordinative, role = create_subordinative(subordinative_candidate, dtree)
-            if role == "adverbial":
-                role = "sub-adverbial"
-            result = {
-                "_type": "adverbial",
-                "adverbial": create_adverbial(dtree),
-                role: subordinative
-            }
-            return result
-    for indirect_object_candidate in reversed(not_included_children(dtree)):
-        if is_indirect_object(indirect_object_candidate, dtree):
-            indirect_object = indirect_object_candidate
-            indirect_object["~included"] = True
-            if is_adverbial_head_as_preposition(dtree):
-                return {
-                    "_type": "adverbial",
-                    "adverbial": create_adverbial(indirect_object),
-                    "preposition": create_preposition(dtree)
-                }
-            return {
-                "_type": "adverbial",
-                "adverbial": create_adverbial(dtree),
-                "indirect-object": create_object(indirect_object)
-            }
-    for adverbial_candidate in reversed(not_included_children(dtree)):
-        if is_adverbial(adverbial_candidate, dtree):
-            adverbial = adverbial_candidate
-            adverbial["~included"] = True
-            return {
-                "_type": "adverbial",
-                "adverbial": create_adverbial(dtree),
-                "sub-adverbial": create_adverbial(adverbial)
-            }
-    for direct_object_candidate in reversed(not_included_children(dtree)):
-        if is_direct_object(direct_object_candidate, dtree) \
-                and not is_flat_object_part(direct_object_candidate, dtree):
-            direct_object = direct_object_candidate
-            direct_object["~included"] = True
-            return {
-                "_type": "adverbial",
-                "adverbial": create_adverbial(dtree),
-                "direct-object": create_object(direct_object)
-            }
-    for particle_candidate in reversed(not_included_children(dtree)):
-        if is_particle(particle_candidate):
-            particle = particle_candidate
-            particle["~included"] = True
-            return {
-                "_type": "adverbial",
-                "adverbial": create_adverbial(dtree),
-                "particle": create_particle(particle)
-            }
-    for preposition_candidate in not_included_children(dtree):
-        if preposition_candidate["deprel"] in constituency_tree_builder.lists._preposition_deprels:
-            preposition = preposition_candidate
-            preposition["~included"] = True
-            return {
-                "_type": "adverbial",
-                "adverbial": create_adverbial(dtree),
-                "preposition": create_preposition(preposition)
-            }
-    for definition_candidate in reversed(not_included_children(dtree)):
-        if is_definition(definition_candidate, dtree):
-            definition = definition_candidate
-            definition["~included"] = True
-            return {
-                "_type": "adverbial",
-                "adverbial": create_adverbial(dtree),
-                "definition": create_definition(definition)
-            }
     dtree = collect_flat_adverbial_parts(dtree)
     return {
         "_type": "adverbial",
@@ -945,6 +696,7 @@ def create_adverbial(dtree):
     }
 
 
+@builder
 def create_definition(dtree):
     homogeneous_parts = [dtree]
     for homogeneous_candidate in not_included_children(dtree):
@@ -956,54 +708,21 @@ def create_definition(dtree):
             "_type": "homogeneous-definitions"
         }
         for ix, part in enumerate(homogeneous_parts):
-            result[f"{constituency_tree_builder.lists._parts_names[ix]}-definition"] = create_definition(part)
+            result[part_key(ix, "definition")] = (yield create_definition, part)
         conjunction_parts = find_conjunction_parts_between(*homogeneous_parts)
         if conjunction_parts:
             conjunction = create_conjunction(*conjunction_parts)
             result["joined-by"] = conjunction
         return result
-    for indirect_object_candidate in reversed(not_included_children(dtree)):
-        if is_indirect_object(indirect_object_candidate, dtree):
-            indirect_object = indirect_object_candidate
-            indirect_object["~included"] = True
-            return {
-                "_type": "definition",
-                "definition": create_definition(dtree),
-                "indirect-object": create_object(indirect_object)
-            }
-    for adverbial_candidate in reversed(not_included_children(dtree)):
-        if is_adverbial(adverbial_candidate, dtree):
-            adverbial = adverbial_candidate
-            adverbial["~included"] = True
-            return {
-                "_type": "definition",
-                "definition": create_definition(dtree),
-                "adverbial": create_adverbial(adverbial)
-            }
-    for definition_candidate in reversed(not_included_children(dtree)):
-        if is_definition(definition_candidate, dtree):
-            definition = definition_candidate
-            definition["~included"] = True
-            return {
-                "_type": "definition",
-                "definition": create_definition(dtree),
-                "sub-definition": create_definition(definition)
-            }
-    for particle_candidate in reversed(not_included_children(dtree)):
-        if is_particle(particle_candidate):
-            particle = particle_candidate
-            particle["~included"] = True
-            return {
-                "_type": "definition",
-                "definition": create_definition(dtree),
-                "particle": create_particle(particle)
-            }
+    result = yield from apply_rules(_definition_rules, dtree, {"reversed": list(reversed(not_included_children(dtree)))})
+    if result is not None:
+        return result
     dtree = collect_flat_definition_parts(dtree)
     if is_enquoted(dtree):
         quotes = create_enclosing_quotes(dtree)
         return {
             "_type": "quoted-group",
-            "content": create_definition(dtree),
+            "content": (yield create_definition, dtree),
             "quotes": quotes
         }
     return {
@@ -1050,10 +769,11 @@ def create_enclosing_brackets(dtree):
     }
 
 
+@builder
 def create_subordinative(dtree, main_word):
     if is_enclosed_in_brackets(dtree):
         brackets = create_enclosing_brackets(dtree)
-        subordinative, role = create_subordinative(dtree, main_word)
+        subordinative, role = (yield create_subordinative, dtree, main_word)
         return {
             "_type": "bracketed-group",
             "content": subordinative,
@@ -1062,7 +782,7 @@ def create_subordinative(dtree, main_word):
     conjunction_parts = find_conjunction_parts_between(dtree, main_word)
     if conjunction_parts:
         conjunction = create_conjunction(*conjunction_parts)
-    core = create_core(dtree)
+    core = (yield create_core, dtree)
     node = {
         "_type": "subordinative",
         "sentence": core,
@@ -1083,6 +803,7 @@ def create_subordinative(dtree, main_word):
     return node, type_
 
 
+@builder
 def create_subordinated_direct_speech(dtree, main_word):
     children = not_included_children(dtree, natural_order=True)
     joinings = []
@@ -1100,14 +821,14 @@ def create_subordinated_direct_speech(dtree, main_word):
         joinings.append(children[-1])
     for joining in joinings:
         joining["~included"] = True
-    joinings[0]["text"] = ' '.join([j["text"] for j in sorted(joinings, key=lambda x: x["id"])])
+    merge_tokens_text(joinings[0], joinings)
     joined_by = {
         "_type": "punct",
         "_token": joinings[0]
     }
     return {
         "_type": "direct-speech",
-        "content": create_sentence(dtree),
+        "content": (yield create_sentence, dtree),
         "joined-by": joined_by
     }
 
@@ -1136,6 +857,7 @@ def create_punct(dtree):
     }
 
 
+@builder
 def create_preposition(dtree):
     parts = not_included_children(dtree)
     if not parts:
@@ -1147,14 +869,16 @@ def create_preposition(dtree):
     for part in parts:
         part["~included"] = True
     parts.sort(key=lambda x: x["id"])
-    return {
-        "_type": "preposition",
-        **{f"{constituency_tree_builder.lists._parts_names[ix]}-part": create_preposition(part) for ix, part in enumerate(parts)}
+    result = {
+        "_type": "preposition"
     }
+    for ix, part in enumerate(parts):
+        result[part_key(ix, "part")] = yield create_preposition, part
+    return result
 
 
 def create_particle(dtree):
-    text = dtree["lemma"].lower()
+    text = dtree["~lemma"]
     type_ = constituency_tree_builder.lists._particle_by_type[text]
     return {
         "_type": type_,
@@ -1176,7 +900,7 @@ def collect_flat_subject_parts(dtree):
             flats.append(node)
     for flat in flats:
         flat["~included"] = True
-    dtree["text"] = ' '.join([f["text"] for f in sorted(flats, key=lambda x: x["id"])])
+    merge_tokens_text(dtree, flats)
     return dtree
 
 
@@ -1198,9 +922,10 @@ def collect_flat_object_parts(dtree):
                 nodes.extend(not_included_children(node))
     for flat in flats:
         flat["~included"] = True
-    dtree["text"] = ' '.join(map(lambda x: x["text"], sorted(flats, key=lambda x: x["id"])))
-    dtree["text"] = dtree["text"].replace(' - ', '-')
-    dtree["text"] = dtree["text"].replace(' -', '-')
+    # Без позиций токенов пробелы вокруг дефиса неизвестны, и они удаляются
+    if not merge_tokens_text(dtree, flats):
+        dtree["text"] = dtree["text"].replace(' - ', '-')
+        dtree["text"] = dtree["text"].replace(' -', '-')
     return dtree
 
 
@@ -1210,3 +935,153 @@ def collect_flat_adverbial_parts(dtree):
 
 def collect_flat_definition_parts(dtree):
     return collect_flat_object_parts(dtree)
+
+
+def emit_subordinative(table, rule, dtree, candidate, context):
+    subordinative, role = (yield create_subordinative, candidate, dtree)
+    head = (yield table.head_builder, dtree)
+    return {
+        "_type": table.node_type,
+        table.head_key: head,
+        table.aliases.get(role, role): subordinative
+    }
+
+
+def emit_subordinated_direct_speech(table, rule, dtree, candidate, context):
+    direct_speech = (yield create_subordinated_direct_speech, candidate, dtree)
+    head = (yield table.head_builder, dtree)
+    return {
+        "_type": table.node_type,
+        table.head_key: head,
+        rule.role: direct_speech
+    }
+
+
+def emit_adverbial_indirect_object(table, rule, dtree, candidate, context):
+    if is_adverbial_head_as_preposition(dtree):
+        return {
+            "_type": "adverbial",
+            "adverbial": (yield create_adverbial, candidate),
+            "preposition": (yield create_preposition, dtree)
+        }
+    return {
+        "_type": "adverbial",
+        "adverbial": (yield create_adverbial, dtree),
+        "indirect-object": (yield create_object, candidate)
+    }
+
+
+def is_predicate_indirect_object(candidate, dtree, context):
+    main_part = context["main_part"]
+    return (is_indirect_object(candidate, dtree)
+            or (context["is_aux_nominative"]
+                and main_part is not None
+                and is_main_part_of_compound_nominative_predicate(main_part, dtree)
+                and is_indirect_object(candidate, main_part)
+                and not is_atomic_nominative_part(candidate, main_part))) \
+        and not (context["is_aux_verb"] and is_main_verb(candidate)) \
+        and not (context["is_aux_nominative"] and candidate is main_part)
+
+
+def is_predicate_adverbial(candidate, dtree, context):
+    if not ((is_adverbial(candidate, dtree) and not context["is_aux_nominative"]
+             or is_adverbial_specific_nominative(candidate, dtree) or has_adverbial_specific_preposition(candidate)
+             or candidate["pos"] == "ADV")
+            and not (context["is_aux_nominative"] and candidate["lemma"] == "так")):
+        return False
+    following = context["following"].get(candidate["id"])
+    return following is None \
+        or is_adverbial_specific_nominative(candidate, dtree) \
+        or not is_adverbial_specific_nominative(following, dtree)
+
+
+def is_dependent_object(candidate, dtree, context):
+    return is_indirect_object(candidate, dtree) \
+        and not is_flat_object_part(candidate, dtree) \
+        and not is_flat_object_head(dtree)
+
+
+_indirect_object_candidate_deprels = constituency_tree_builder.lists._indirect_object_candidate_deprels
+
+_preposition_deprels = constituency_tree_builder.lists._preposition_deprels
+
+_verb_subject_rules = compile_rules("subject", "subject", create_verb_subject, [
+    Rule(10, "object", lambda c, d, ctx: is_indirect_object(c, d), create_object,
+         deprels=_indirect_object_candidate_deprels),
+    Rule(20, "adverbial", lambda c, d, ctx: is_adverbial(c, d), create_adverbial,
+         excluded_pos=constituency_tree_builder.lists._particle_pos),
+    Rule(30, "object", lambda c, d, ctx: True, create_object,
+         deprels=constituency_tree_builder.lists._direct_object_deprels),
+    Rule(40, "particle", lambda c, d, ctx: is_particle(c), create_particle, source="reversed"),
+])
+
+_subject_rules = compile_rules("subject", "subject", create_subject, [
+    Rule(10, None, lambda c, d, ctx: is_subordinative(c, d), emit=emit_subordinative),
+    Rule(20, "indirect-object", lambda c, d, ctx: is_indirect_object(c, d), create_object,
+         deprels=_indirect_object_candidate_deprels),
+    Rule(30, "definition", lambda c, d, ctx: is_definition(c, d) and not is_proper_noun_definition(c, d),
+         create_definition),
+    Rule(40, "direct-object", lambda c, d, ctx: is_direct_object(c, d), create_object),
+    Rule(50, "definition", lambda c, d, ctx: is_proper_noun_definition(c, d), create_definition),
+    Rule(60, "particle", lambda c, d, ctx: is_particle(c), create_particle, source="reversed"),
+])
+
+_predicate_clause_rules = compile_rules("predicate", "predicate", create_predicate, [
+    Rule(10, None, lambda c, d, ctx: is_subordinative(c, d), emit=emit_subordinative),
+    Rule(20, "indirect-object", lambda c, d, ctx: is_subordinated_direct_speech(c, d),
+         emit=emit_subordinated_direct_speech),
+])
+
+_predicate_rules = compile_rules("predicate", "predicate", create_predicate, [
+    Rule(10, "indirect-object", is_predicate_indirect_object, create_object, source="reversed",
+         deprels=_indirect_object_candidate_deprels, excluded_pos={"ADJ"}),
+    Rule(20, "adverbial", is_predicate_adverbial, create_adverbial, source="reversed"),
+    Rule(30, "definition", lambda c, d, ctx: is_definition(c, d), create_definition, source="own-reversed",
+         when=lambda d, ctx: is_main_part_of_compound_nominative_predicate(d)),
+    Rule(40, "definition", lambda c, d, ctx: is_definition(c, ctx["main_part"]), create_definition,
+         source="reversed", when=lambda d, ctx: ctx["is_aux_nominative"]),
+    Rule(50, "direct-object", lambda c, d, ctx: is_direct_object(c, d), create_object, source="reversed"),
+    Rule(60, "particle", lambda c, d, ctx: is_particle(c), create_particle, source="reversed"),
+])
+
+_main_nominative_rules = compile_rules("main-nominative", "main-nominative", create_main_nominative, [
+    Rule(10, "indirect-object", is_dependent_object, create_object, source="reversed",
+         deprels=_indirect_object_candidate_deprels),
+    Rule(20, "particle", lambda c, d, ctx: is_particle(c) and c["~lemma"] != "все", create_particle,
+         source="reversed"),
+    Rule(30, "preposition", lambda c, d, ctx: True, create_preposition, deprels=_preposition_deprels),
+])
+
+_object_rules = compile_rules("object", "object", create_object, [
+    Rule(10, None, lambda c, d, ctx: is_subordinative(c, d), emit=emit_subordinative),
+    Rule(20, "indirect-object", is_dependent_object, create_object, deprels=_indirect_object_candidate_deprels),
+    Rule(30, "adverbial", lambda c, d, ctx: is_adverbial(c, d), create_adverbial,
+         excluded_pos=constituency_tree_builder.lists._particle_pos),
+    Rule(40, "direct-object", lambda c, d, ctx: is_direct_object(c, d) and not is_flat_object_part(c, d),
+         create_object),
+    Rule(50, "particle", lambda c, d, ctx: is_particle(c), create_particle),
+    Rule(60, "preposition", lambda c, d, ctx: True, create_preposition, deprels=_preposition_deprels),
+    Rule(70, "definition", lambda c, d, ctx: is_definition(c, d), create_definition),
+])
+
+_adverbial_rules = compile_rules("adverbial", "adverbial", create_adverbial, [
+    Rule(10, None, lambda c, d, ctx: is_subordinative(c, d), source="reversed", emit=emit_subordinative),
+    Rule(20, "indirect-object", lambda c, d, ctx: is_indirect_object(c, d), source="reversed",
+         deprels=_indirect_object_candidate_deprels, emit=emit_adverbial_indirect_object),
+    Rule(30, "sub-adverbial", lambda c, d, ctx: is_adverbial(c, d), create_adverbial, source="reversed",
+         excluded_pos=constituency_tree_builder.lists._particle_pos),
+    Rule(40, "direct-object", lambda c, d, ctx: is_direct_object(c, d) and not is_flat_object_part(c, d),
+         create_object, source="reversed"),
+    Rule(50, "particle", lambda c, d, ctx: is_particle(c), create_particle, source="reversed"),
+    Rule(60, "preposition", lambda c, d, ctx: True, create_preposition, deprels=_preposition_deprels),
+    Rule(70, "definition", lambda c, d, ctx: is_definition(c, d), create_definition, source="reversed"),
+], aliases={"adverbial": "sub-adverbial"})
+
+_definition_rules = compile_rules("definition", "definition", create_definition, [
+    Rule(10, "indirect-object", lambda c, d, ctx: is_indirect_object(c, d), create_object, source="reversed",
+         deprels=_indirect_object_candidate_deprels),
+    Rule(20, "adverbial", lambda c, d, ctx: is_adverbial(c, d), create_adverbial, source="reversed",
+         excluded_pos=constituency_tree_builder.lists._particle_pos),
+    Rule(30, "sub-definition", lambda c, d, ctx: is_definition(c, d), create_definition, source="reversed"),
+    Rule(40, "particle", lambda c, d, ctx: is_particle(c), create_particle, source="reversed"),
+])
@@ -0,0 +1,116 @@
+# Copyright © 2023 Anatoliy Poletaev, Ilya Paramonov, Elena Boychuk. All rights reserved.
+
+import io
+from collections import defaultdict
+
+
+def is_root(word):
+    return word["head_id"] == -1 or word["head_id"] == word["id"]
+
+
+def write_tree(json_, stream, spaces=2):
+    children = defaultdict(list)
+    for word in json_:
+        if not is_root(word):
+            children[word["head_id"]].append(word)
+    root = next(filter(lambda x: x["deprel"] == "root", json_), None)
+    if root is None:
+        for word in json_:
+            stream.write(f"{word['id']}, {word['text']}, {word['head_id']}, {word['deprel']}\n")
+        return
+    # Токены, до которых обход доходит повторно (связи разбора образуют цикл), пропускаются
+    nodes, visited = [(root, 0)], set()
+    while nodes:
+        word, depth = nodes.pop()
+        if word["id"] in visited:
+            continue
+        visited.add(word["id"])
+        stream.write(f"{' ' * (spaces * depth)}{word['deprel']} - {word['text']}\n")
+        nodes.extend((child, depth + 1) for child in reversed(children[word["id"]]))
+
+
+def tree_repr(json_):
+    stream = io.StringIO()
+    write_tree(json_, stream)
+    return stream.getvalue().rstrip("\n")
+
+
+def format_feats(feats):
+    if not feats:
+        return "_"
+    if isinstance(feats, str):
+        return feats
+    return "|".join(f"{key}={value}" for key, value in sorted(feats.items(), key=lambda x: x[0].lower()))
+
+
+def write_conllu(json_, stream, sentence_id=None, text=None):
+    if sentence_id is not None:
+        stream.write(f"# sent_id = {sentence_id}\n")
+    if text is not None:
+        stream.write(f"# text = {text}\n")
+    for word in json_:
+        misc = "_"
+        if "start" in word and "stop" in word:
+            misc = f"start_char={word['start']}|end_char={word['stop']}"
+        stream.write("\t".join([str(word["id"] + 1),
+                                word["text"],
+                                word.get("lemma") or "_",
+                                word.get("pos") or "_",
+                                "_",
+                                format_feats(word.get("feats")),
+                                "0" if is_root(word) else str(word["head_id"] + 1),
+                                word["deprel"],
+                                "_",
+                                misc]))
+        stream.write("\n")
+    stream.write("\n")
+
+
+# Пустой столбец FEATS означает, что признаков нет, а не что их набор пуст
+def parse_feats(feats):
+    if feats in {"_", ""}:
+        return None
+    return dict(feature.split("=", 1) for feature in feats.split("|") if "=" in feature)
+
+
+def parse_misc(misc):
+    if misc == "_":
+        return {}
+    return dict(item.split("=", 1) for item in misc.split("|") if "=" in item)
+
+
+# Чтение CoNLL-U по одному предложению: для каждого предложения возвращаются
+# его метаданные (комментарии вида "# ключ = значение") и список токенов.
+# Строки многословных токенов (1-2) и пустых узлов (1.1) пропускаются
+def read_conllu(stream):
+    metadata, json_ = {}, []
+    for line in stream:
+        line = line.rstrip("\r\n")
+        if not line:
+            if json_:
+                yield metadata, json_
+            metadata, json_ = {}, []
+            continue
+        if line.startswith("#"):
+            key, separator, value = line[1:].partition("=")
+            if separator:
+                metadata[key.strip()] = value.strip()
+            continue
+        columns = line.split("\t")
+        if not columns[0].isdigit():
+            continue
+        id_, text, lemma, upos, _, feats, head, deprel, _, misc = columns
+        word = {"id": int(id_) - 1,
+                "text": text,
+                "lemma": lemma,
+                "pos": upos.upper(),
+                "head_id": int(head) - 1,
+                "deprel": deprel.lower(),
+                "feats": parse_feats(feats)}
+        misc = parse_misc(misc)
+        if "start_char" in misc and "end_char" in misc:
+            word["start"] = int(misc["start_char"])
+            word["stop"] = int(misc["end_char"])
+        json_.append(word)
+    if json_:
+        yield metadata, json_
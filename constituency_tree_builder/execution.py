@@ -0,0 +1,99 @@
+# Copyright © 2023 Anatoliy Poletaev, Ilya Paramonov, Elena Boychuk. All rights reserved.
+
+import time
+from collections import namedtuple
+from functools import wraps
+
+# Построители составляющих записаны как генераторы: вместо рекурсивного вызова
+# построитель выдаёт кортеж (функция, *аргументы) и получает обратно результат.
+# Исполнитель хранит незавершённые построители в явном стеке, поэтому глубина
+# дерева не ограничена глубиной рекурсии Python.
+
+# Кэш вызовов построителей: lookup(function, args) -> (ticket, value).
+# Если value не None, построитель не запускается и его результатом считается value;
+# иначе после завершения построителя вызывается store(ticket, value), если ticket не None.
+CallCache = namedtuple("CallCache", ["lookup", "store"])
+
+# Ограничение работы исполнителя на одно предложение: не больше steps шагов (запросов построителей)
+# и не больше seconds секунд. Время проверяется между шагами, поэтому один шаг не прерывается
+Budget = namedtuple("Budget", ["steps", "seconds"], defaults=[None, None])
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def start_budget(budget):
+    if budget is None:
+        return None
+    return {
+        "budget": budget,
+        "spent": 0,
+        "deadline": None if budget.seconds is None else time.perf_counter() + budget.seconds
+    }
+
+
+def spend(meter):
+    meter["spent"] += 1
+    budget = meter["budget"]
+    if budget.steps is not None and meter["spent"] > budget.steps:
+        raise BudgetExceeded(f"step budget of {budget.steps} exceeded")
+    if meter["deadline"] is not None and time.perf_counter() > meter["deadline"]:
+        raise BudgetExceeded(f"time budget of {budget.seconds} s exceeded")
+
+
+def builder(generator_function):
+    @wraps(generator_function)
+    def run(*args):
+        return execute(generator_function(*args))
+    run.steps = generator_function
+    return run
+
+
+def execute(steps, iterative=True, cache=None, budget=None):
+    meter = start_budget(budget)
+    if not iterative:
+        return execute_recursively(steps, cache, meter)
+    stack = [(steps, None)]
+    value = None
+    while stack:
+        if meter is not None:
+            spend(meter)
+        try:
+            request = stack[-1][0].send(value)
+        except StopIteration as stop:
+            _, ticket = stack.pop()
+            value = stop.value
+            if ticket is not None:
+                cache.store(ticket, value)
+            continue
+        function, *args = request
+        generator_function = getattr(function, "steps", None)
+        if generator_function is None:
+            value = function(*args)
+            continue
+        ticket, value = (None, None) if cache is None else cache.lookup(function, args)
+        if value is None:
+            stack.append((generator_function(*args), ticket))
+    return value
+
+
+def execute_recursively(steps, cache=None, meter=None):
+    value = None
+    while True:
+        if meter is not None:
+            spend(meter)
+        try:
+            request = steps.send(value)
+        except StopIteration as stop:
+            return stop.value
+        function, *args = request
+        generator_function = getattr(function, "steps", None)
+        if generator_function is None:
+            value = function(*args)
+            continue
+        ticket, value = (None, None) if cache is None else cache.lookup(function, args)
+        if value is None:
+            value = execute_recursively(generator_function(*args), cache, meter)
+            if ticket is not None:
+                cache.store(ticket, value)
@@ -0,0 +1,316 @@
+# Copyright © 2023 Anatoliy Poletaev, Ilya Paramonov, Elena Boychuk. All rights reserved.
+
+from copy import deepcopy
+
+from constituency_tree_builder.creator import dependency_tree_to_constituency_tree, create_sentence, \
+    create_core, create_introduction, create_verb_subject, create_subject, create_predicate, \
+    create_main_nominative, create_object, create_adverbial, create_definition, create_preposition
+from constituency_tree_builder.execution import CallCache
+from constituency_tree_builder.utils import json_to_dependency_tree
+
+# Построители, которые при вызове с одним аргументом читают и изменяют только поддерево
+# этого аргумента. Их результат полностью определяется состоянием токенов поддерева,
+# поэтому его можно переиспользовать после правки, не затронувшей поддерево.
+_cacheable_builders = {
+    create_sentence,
+    create_core,
+    create_introduction,
+    create_verb_subject,
+    create_subject,
+    create_predicate,
+    create_main_nominative,
+    create_object,
+    create_adverbial,
+    create_definition,
+    create_preposition,
+}
+
+
+def start_incremental_conversion(json_):
+    state = {
+        "json": deepcopy(json_),
+        "cache": {},
+        "subtrees": {},
+        "next_subtree": 0,
+        "tree": None
+    }
+    convert(state)
+    return state
+
+
+def apply_dependency_edit(state, token_id, head_id=None, deprel=None):
+    tokens_by_id = {token["id"]: token for token in state["json"]}
+    if token_id not in tokens_by_id:
+        raise ValueError(f"Unknown token id: {token_id}")
+    if head_id is not None and head_id != -1 and head_id not in tokens_by_id:
+        raise ValueError(f"Unknown head id: {head_id}")
+    token = tokens_by_id[token_id]
+    if head_id is not None:
+        token["head_id"] = head_id
+    if deprel is not None:
+        token["deprel"] = deprel
+    previous_tree = state["tree"]
+    report = convert(state)
+    report["changed"] = changed_paths(previous_tree, state["tree"])
+    return report
+
+
+# Ключ вызова построителя - имя построителя и номер состояния поддерева аргумента в момент вызова.
+# Номер присваивается паре (состояние токена, номера поддеревьев его детей) и хранится в таблице
+# между преобразованиями, поэтому одинаковые поддеревья получают одинаковые номера. Номер поддерева
+# запоминается в токене и сбрасывается при изменении токена или его потомков: после правки номера
+# вычисляются заново только для изменённых токенов и их предков, а не обходом всего поддерева.
+# В записи кэша хранятся не копии всех токенов поддерева, а состояния токенов, изменённых самим
+# построителем, и ссылки на записи вложенных вызовов
+def convert(state):
+    frames = []
+    tokens = [TrackedToken(frames, copy_fields(token)) for token in state["json"]]
+    tokens_by_id = {token["id"]: token for token in tokens}
+    previous_cache, cache = state["cache"], {}
+    previous_subtrees, subtrees = state["subtrees"], {}
+    skeletons, reprs = {}, {}
+    report = {"rebuilt": 0, "reused": 0, "rebuilt_ids": set()}
+
+    def subtree_number(token):
+        if token.number is not None:
+            return token.number
+        order, nodes = [], [token]
+        while nodes:
+            node = nodes.pop()
+            order.append(node)
+            nodes.extend(child for child in node["~children"] if child.number is None)
+        for node in reversed(order):
+            key = (token_state(node, reprs), tuple(child.number for child in node["~children"]))
+            number = subtrees.get(key)
+            if number is None:
+                number = previous_subtrees.get(key)
+                if number is None:
+                    number = state["next_subtree"]
+                    state["next_subtree"] += 1
+                subtrees[key] = number
+            node.number = number
+        return token.number
+
+    def lookup(function, args):
+        if len(args) != 1 or function not in _cacheable_builders:
+            return None, None
+        key = (function.__name__, subtree_number(args[0]))
+        entry = cache.get(key) or previous_cache.get(key)
+        if entry is None:
+            report["rebuilt"] += 1
+            report["rebuilt_ids"].add(args[0]["id"])
+            frames.append({"changes": [], "touched": {}})
+            return key, None
+        cache[key] = entry
+        report["reused"] += 1
+        skeleton, changes = entry
+        if frames:
+            frames[-1]["changes"].append(changes)
+        restore_changes(changes, tokens_by_id)
+        value = restore_constituent(skeleton, tokens_by_id)
+        skeletons[id(value)] = (value, skeleton)
+        return None, value
+
+    def store(key, value):
+        frame = frames.pop()
+        changes = frame["changes"] + [token_snapshot(token) for token in frame["touched"].values()]
+        skeleton = constituent_skeleton(value, skeletons)
+        skeletons[id(value)] = (value, skeleton)
+        cache[key] = (skeleton, changes)
+        if frames:
+            frames[-1]["changes"].append(changes)
+
+    state["tree"] = dependency_tree_to_constituency_tree(json_to_dependency_tree(tokens),
+                                                         cache=CallCache(lookup, store))
+    state["cache"] = cache
+    state["subtrees"] = subtrees
+    report["tree"] = state["tree"]
+    return report
+
+
+# Токен, который сообщает о своих изменениях: сбрасывает номера поддеревьев у себя и у предков
+# и отмечается как изменённый в текущем вызове построителя. Предки определяются по спискам
+# "~children", в которые токен когда-либо добавлялся
+class TrackedToken(dict):
+    __slots__ = ("frames", "number", "parents")
+
+    def __init__(self, frames, fields):
+        super().__init__(fields)
+        self.frames = frames
+        self.number = None
+        self.parents = []
+
+    def __setitem__(self, key, value):
+        if key == "~children":
+            value = TrackedChildren(self, value)
+        super().__setitem__(key, value)
+        touch(self)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        touch(self)
+
+    def update(self, fields=(), **kwargs):
+        for key, value in dict(fields, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        touch(self)
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+        touch(self)
+        return item
+
+    def clear(self):
+        super().clear()
+        touch(self)
+
+
+def touch(token):
+    if token.frames:
+        token.frames[-1]["touched"][id(token)] = token
+    nodes = [token]
+    while nodes:
+        node = nodes.pop()
+        if node.number is None:
+            continue
+        node.number = None
+        nodes.extend(node.parents)
+
+
+def adopt(owner, children):
+    for child in children:
+        if owner not in child.parents:
+            child.parents.append(owner)
+    touch(owner)
+
+
+def tracked(method):
+    def run(self, *args):
+        result = method(self, *args)
+        adopt(self.owner, self)
+        return result
+    return run
+
+
+class TrackedChildren(list):
+    __slots__ = ("owner",)
+
+    def __init__(self, owner, children):
+        super().__init__(children)
+        self.owner = owner
+        adopt(owner, self)
+
+    append = tracked(list.append)
+    extend = tracked(list.extend)
+    insert = tracked(list.insert)
+    remove = tracked(list.remove)
+    pop = tracked(list.pop)
+    sort = tracked(list.sort)
+    reverse = tracked(list.reverse)
+    __setitem__ = tracked(list.__setitem__)
+    __delitem__ = tracked(list.__delitem__)
+    __iadd__ = tracked(list.__iadd__)
+
+
+_scalar_types = (str, int, float, bool, type(None))
+
+
+# Составные значения не изменяются (см. copy_fields), поэтому их представления запоминаются
+def token_state(token, reprs):
+    state = []
+    for key, value in sorted(token.items()):
+        if key == "~children":
+            continue
+        if not isinstance(value, _scalar_types):
+            value_repr = reprs.get(id(value))
+            if value_repr is None or value_repr[0] is not value:
+                value_repr = reprs[id(value)] = (value, repr(value))
+            value = value_repr[1]
+        state.append((key, value))
+    return tuple(state)
+
+
+# Составные значения полей (признаки, сведения о знаках препинания) построители не изменяют,
+# поэтому копии токенов разделяют их
+def copy_fields(token):
+    return {key: value for key, value in token.items() if key != "~children"}
+
+
+def token_snapshot(token):
+    snapshot = copy_fields(token)
+    snapshot["~children"] = [child["id"] for child in token["~children"]]
+    return snapshot
+
+
+def restore_token(snapshot, tokens_by_id):
+    token = tokens_by_id[snapshot["id"]]
+    dict.clear(token)
+    dict.update(token, copy_fields(snapshot))
+    token["~children"] = [tokens_by_id[child_id] for child_id in snapshot["~children"]]
+
+
+# Изменения вызова применяются в порядке записи: сначала изменения вложенных вызовов,
+# затем окончательные состояния токенов, изменённых самим вызовом
+def restore_changes(changes, tokens_by_id):
+    iterators = [iter(changes)]
+    while iterators:
+        change = next(iterators[-1], None)
+        if change is None:
+            iterators.pop()
+        elif isinstance(change, list):
+            iterators.append(iter(change))
+        else:
+            restore_token(change, tokens_by_id)
+
+
+# Результаты вложенных вызовов входят в результат внешнего вызова без изменений, поэтому
+# их скелеты (skeletons: id составляющей -> составляющая и её скелет) используются повторно
+def constituent_skeleton(ctree, skeletons=None):
+    return map_constituents(ctree, lambda token: token["id"], skeletons)
+
+
+def restore_constituent(skeleton, tokens_by_id):
+    return map_constituents(skeleton, lambda token_id: tokens_by_id[token_id])
+
+
+def map_constituents(ctree, map_token, known=None):
+    result = {}
+    nodes = [(ctree, result)]
+    while nodes:
+        node, copy = nodes.pop()
+        for key, value in node.items():
+            if key == "_token":
+                copy[key] = map_token(value)
+            elif key.startswith("_"):
+                copy[key] = value
+            elif known is not None and known.get(id(value), (None,))[0] is value:
+                copy[key] = known[id(value)][1]
+            else:
+                copy[key] = {}
+                nodes.append((value, copy[key]))
+    return result
+
+
+def changed_paths(old_ctree, new_ctree):
+    changed = []
+    nodes = [((), old_ctree, new_ctree)]
+    while nodes:
+        path, old, new = nodes.pop()
+        old_keys = None if old is None else [key for key in old if not key.startswith("_")]
+        new_keys = None if new is None else [key for key in new if not key.startswith("_")]
+        if old is None or new is None or old.get("_type") != new.get("_type") \
+                or old.get("_token") != new.get("_token") or old_keys != new_keys:
+            changed.append(path)
+            continue
+        for key in new_keys:
+            nodes.append((path + (key,), old[key], new[key]))
+    return sorted(changed)
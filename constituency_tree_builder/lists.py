@@ -49,6 +49,9 @@ _indirect_object_deprels = {
     "xcomp",
 }
 
+# deprel, без которого is_indirect_object не может вернуть True
+_indirect_object_candidate_deprels = _indirect_object_deprels | {"nummod:gov", "nsubj", "flat:foreign", "advcl"}
+
 _flat_object_part_deprels = {
     "nummod",
     "nummod:gov",
@@ -113,6 +116,8 @@ _adverbial_specific_preposition_lemmas = {
     "из-за",
 }
 
+_adverbial_specific_preposition_length = max(len(lemma.split()) for lemma in _adverbial_specific_preposition_lemmas)
+
 _adverbial_specific_nominatives_lemmas = {
     "ночь",
     "утро",
@@ -240,6 +245,10 @@ _sustainable_introductions = {
     ("вообще", "-", "то"),
 }
 
+_sustainable_introduction_texts = {" ".join(introduction) for introduction in _sustainable_introductions}
+
+_sustainable_introduction_length = max(map(len, _sustainable_introductions))
+
 _particle_pos = {
     "PART",
 }
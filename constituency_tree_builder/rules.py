@@ -0,0 +1,62 @@
+# Copyright © 2023 Anatoliy Poletaev, Ilya Paramonov, Elena Boychuk. All rights reserved.
+
+from collections import namedtuple
+
+# Правило присоединения зависимого слова к составляющей:
+#   priority     - порядок применения правил в таблице (меньше - раньше)
+#   role         - ключ, под которым зависимая составляющая попадает в узел
+#   condition    - condition(candidate, dtree, context) -> bool
+#   builder      - строит зависимую составляющую по кандидату
+#   source       - имя списка кандидатов, который передаёт построитель
+#   deprels      - если задано, кандидаты с другими deprel отбрасываются без вызова condition
+#   excluded_pos - кандидаты с этими pos отбрасываются без вызова condition
+#   when         - when(dtree, context) -> bool, проверяется один раз перед применением правила
+#   emit         - emit(table, rule, dtree, candidate, context), если узел строится не по общей схеме
+Rule = namedtuple("Rule", ["priority", "role", "condition", "builder", "source", "deprels", "excluded_pos",
+                           "when", "emit"],
+                  defaults=[None, "children", None, None, None, None])
+
+RuleTable = namedtuple("RuleTable", ["node_type", "head_key", "head_builder", "rules", "aliases", "masks"])
+
+
+def compile_rules(node_type, head_key, head_builder, rules, aliases=None):
+    rules = tuple(sorted(rules, key=lambda x: x.priority))
+    return RuleTable(node_type, head_key, head_builder, rules, aliases or {}, {})
+
+
+def admission_mask(table, candidate):
+    key = (candidate["deprel"], candidate["pos"])
+    mask = table.masks.get(key)
+    if mask is None:
+        mask = 0
+        for ix, rule in enumerate(table.rules):
+            if rule.deprels is not None and key[0] not in rule.deprels:
+                continue
+            if rule.excluded_pos is not None and key[1] in rule.excluded_pos:
+                continue
+            mask |= 1 << ix
+        table.masks[key] = mask
+    return mask
+
+
+def apply_rules(table, dtree, sources, context=None):
+    masks = {}
+    for ix, rule in enumerate(table.rules):
+        if rule.when is not None and not rule.when(dtree, context):
+            continue
+        candidates = sources[rule.source]
+        if rule.source not in masks:
+            masks[rule.source] = [admission_mask(table, candidate) for candidate in candidates]
+        bit = 1 << ix
+        for candidate, mask in zip(candidates, masks[rule.source]):
+            if not mask & bit or not rule.condition(candidate, dtree, context):
+                continue
+            candidate["~included"] = True
+            if rule.emit is not None:
+                return (yield from rule.emit(table, rule, dtree, candidate, context))
+            return {
+                "_type": table.node_type,
+                table.head_key: (yield table.head_builder, dtree),
+                rule.role: (yield rule.builder, candidate)
+            }
+    return None
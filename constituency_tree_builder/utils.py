@@ -1,51 +1,51 @@
 # Copyright © 2023 Anatoliy Poletaev, Ilya Paramonov, Elena Boychuk. All rights reserved.
 
+from bisect import bisect_left
+from collections import defaultdict
 from copy import deepcopy
-from functools import reduce
+from sys import intern
 
 from constituency_tree_builder.lists import _conjunction_deprels,\
     _subordinative_conjunction_lemmas, _opening_brackets, _closing_brackets, \
     _opening_quotes, _closing_quotes, _conjunction_types,\
-    _direct_speech_border_tokens
+    _direct_speech_border_tokens, _parts_names
+
+
+_brackets = _opening_brackets | _closing_brackets
+_quotes = _opening_quotes | _closing_quotes
 
 
 def find_conjunction_parts_between(*tokens):
-    tokens = list(tokens)
-    tokens.sort(key=lambda x: x["id"])
+    tokens = sorted(tokens, key=lambda x: x["id"])
     start, end = tokens[0]["id"], tokens[-1]["id"]
     result = []
-    children = reduce(list.__add__, map(not_included_children, tokens))
-    children.sort(key=lambda x: x["id"])
+    # Непосредственные зависимые всех вершин, упорядоченные по номеру, собираются
+    # одной сортировкой, без попарного объединения списков
+    children = sorted((child for token in tokens for child in token["~children"] if not child["~included"]),
+                      key=lambda x: x["id"])
     has_conjunctive_word = False
     for child in children:
-        if child["text"] in (_opening_brackets | _closing_brackets):
+        if child["text"] in _brackets:
             continue
         if child["deprel"] in _conjunction_deprels:
             result.append(child)
             if child["text"].lower() == "если":
                 has_conjunctive_word = True
-            for part in not_included_children(child):
-                if part["deprel"] == "fixed":
-                    result.append(part)
-                elif part["pos"] in {"PART", "ADP"}:
-                    result.append(part)
+            result.extend(conjunction_tail(child))
             continue
         if child["lemma"] in _subordinative_conjunction_lemmas and not has_conjunctive_word:
             result.append(child)
-            for part in not_included_children(child):
-                if part["deprel"] == "fixed":
-                    result.append(part)
-                elif part["pos"] in {"PART", "ADP"}:
-                    result.append(part)
+            result.extend(conjunction_tail(child))
             continue
-        if child["deprel"] == "punct" and start < child["id"] < end \
-                and child["lemma"] not in (_opening_quotes | _closing_quotes):
+        if child["deprel"] == "punct" and start < child["id"] < end and child["lemma"] not in _quotes:
             result.append(child)
             continue
-        if get_full_text(tokens_list(child)).lower() in {"не только"}:
-            result.extend(tokens_list(child))
+        subtree = small_subtree(child, 2)
+        if subtree is not None and get_full_text(subtree).lower() in {"не только"}:
+            result.extend(subtree)
             continue
-    if get_full_text(result) == ", а":
+    # Текст из трёх и более токенов содержит не меньше двух пробелов и не может совпасть с ", а"
+    if len(result) <= 2 and get_full_text(result) == ", а":
         negative_particle_candidate = tokens_list(tokens[0])[0]
         if negative_particle_candidate["lemma"] == "не":
             negative_particle = negative_particle_candidate
@@ -53,11 +53,31 @@ def find_conjunction_parts_between(*tokens):
     return result
 
 
+def conjunction_tail(conjunction):
+    return [part for part in not_included_children(conjunction)
+            if part["deprel"] == "fixed" or part["pos"] in {"PART", "ADP"}]
+
+
+# Поддерево из не более чем limit токенов, упорядоченных по номеру, или None, если токенов больше.
+# Обход прекращается, как только предел превышен, поэтому стоимость не зависит от размера поддерева
+def small_subtree(dtree, limit):
+    result = []
+    nodes = [dtree]
+    while nodes:
+        node = nodes.pop()
+        result.append(node)
+        if len(result) > limit:
+            return None
+        nodes.extend(child for child in node["~children"] if not child["~included"])
+    result.sort(key=lambda x: x["id"])
+    return result
+
+
 def tokens_list(dtree):
     result = []
     nodes = [dtree]
     while nodes:
-        node = nodes.pop(0)
+        node = nodes.pop()
         nodes.extend(not_included_children(node))
         result.append(node)
     result.sort(key=lambda x: x["id"])
@@ -82,10 +102,81 @@ def get_full_text(tokens):
     return ' '.join([t["text"] for t in sorted(tokens, key=lambda x: x["id"])])
 
 
+# Текст поддерева, если в нём не больше limit токенов, иначе None. Текст из n токенов содержит
+# не меньше n - 1 пробелов, поэтому при сравнении с фразами не длиннее limit слов текст
+# большего поддерева строить не нужно
+def short_subtree_text(dtree, limit):
+    subtree = small_subtree(dtree, limit)
+    return None if subtree is None else get_full_text(subtree)
+
+
+def has_offsets(tokens):
+    return all("start" in token and "stop" in token for token in tokens)
+
+
+# Текст группы токенов с исходными пробелами: если у токенов есть позиции в тексте предложения
+# (start, stop), соседние токены без промежутка между ними соединяются без пробела, а главный
+# токен группы получает позиции всего фрагмента. Без позиций токены соединяются через пробел
+def join_text(tokens):
+    tokens = sorted(tokens, key=lambda x: x["id"])
+    if not has_offsets(tokens):
+        return None
+    parts = [tokens[0]["text"]]
+    for previous, token in zip(tokens, tokens[1:]):
+        if previous["stop"] < token["start"]:
+            parts.append(" ")
+        parts.append(token["text"])
+    return "".join(parts)
+
+
+def merge_tokens_text(token, tokens):
+    text = join_text(tokens)
+    if text is None:
+        token["text"] = get_full_text(tokens)
+        return False
+    token["text"] = text
+    token["start"] = min(part["start"] for part in tokens)
+    token["stop"] = max(part["stop"] for part in tokens)
+    return True
+
+
+# Границы фрагмента исходного текста, покрываемого составляющей, и сам фрагмент.
+# Вычисляются по позициям токенов составляющей при обращении, в дереве не хранятся
+def constituent_span(ctree):
+    starts, stops = [], []
+    nodes = [ctree]
+    while nodes:
+        node = nodes.pop()
+        for key, value in node.items():
+            if key == "_token":
+                if "start" not in value or "stop" not in value:
+                    return None
+                starts.append(value["start"])
+                stops.append(value["stop"])
+            elif not key.startswith("_"):
+                nodes.append(value)
+    if not starts:
+        return None
+    return min(starts), max(stops)
+
+
+def constituent_text(ctree, text, offset=0):
+    span = constituent_span(ctree)
+    if span is None:
+        return None
+    start, stop = span
+    return text[start - offset:stop - offset]
+
+
 def json_to_dependency_tree(json_):
+    normalize_tokens(json_)
+    index_punctuation_marks(json_)
+    words_by_head = defaultdict(list)
+    for word in json_:
+        words_by_head[word["head_id"]].append(word)
 
     def find_children(word):
-        return list(filter(lambda x: x["head_id"] == word["id"] and x != word, json_))
+        return [x for x in words_by_head[word["id"]] if x is not word]
     try:
         root = next(filter(lambda x: x["deprel"] == "root", json_))
     except StopIteration:
@@ -103,22 +194,105 @@ def json_to_dependency_tree(json_):
     return root
 
 
-def clean_constituency_tree(ctree):
-    ctree = deepcopy(ctree)
-    nodes = [ctree]
-    tokens = []
+# Части речи, типы связей и леммы токенов интернируются: проверки принадлежности таблицам
+# из lists.py сравнивают строки сначала по идентичности. Лемма в нижнем регистре, с которой
+# сравнивается большинство проверок, вычисляется один раз и хранится в "~lemma"; леммы при
+# построении дерева не изменяются, в отличие от текстов, которые объединяются. Если анализатор
+# не выдал лемму, вместо неё используется текст токена
+def normalize_tokens(json_):
+    for word in json_:
+        word["pos"] = intern(word["pos"])
+        word["deprel"] = intern(word["deprel"])
+        word["lemma"] = intern(word["lemma"] if word["lemma"] is not None else word["text"])
+        word["~lemma"] = intern(word["lemma"].lower())
+
+
+# Упорядоченные номера кавычек и скобок в предложении, общие для всех его токенов. Тексты токенов
+# при построении дерева только объединяются, поэтому новые кавычки и скобки не появляются, и проверки
+# на заключённость в кавычки или скобки находят нужные знаки двоичным поиском, не обходя поддерево
+def index_punctuation_marks(json_):
+    marks = {kind: [] for kind in ("quotes", "opening_quotes", "closing_quotes",
+                                   "opening_brackets", "closing_brackets")}
+    for word in sorted(json_, key=lambda x: x["id"]):
+        if word["text"] in _quotes:
+            marks["quotes"].append(word["id"])
+        if word["text"] in _opening_quotes:
+            marks["opening_quotes"].append(word["id"])
+        if word["text"] in _closing_quotes:
+            marks["closing_quotes"].append(word["id"])
+        if word["lemma"] in _opening_brackets:
+            marks["opening_brackets"].append(word["id"])
+        if word["lemma"] in _closing_brackets:
+            marks["closing_brackets"].append(word["id"])
+    for word in json_:
+        word["~marks"] = marks
+
+
+# Есть ли в предложении знаки вида kind с номерами от first_id до last_id включительно;
+# отсутствующая граница не ограничивает поиск
+def has_punctuation_marks(dtree, kind, first_id=None, last_id=None):
+    marks = dtree.get("~marks")
+    if marks is None:
+        return True
+    ids = marks[kind]
+    index = 0 if first_id is None else bisect_left(ids, first_id)
+    return index < len(ids) and (last_id is None or ids[index] <= last_id)
+
+
+# Наименьший и наибольший номера не включённых непосредственных потомков или None, если их нет
+def children_bounds(dtree):
+    ids = [child["id"] for child in dtree["~children"] if not child["~included"]]
+    if not ids:
+        return None
+    return min(ids), max(ids)
+
+
+# Первый и последний по номеру токены поддерева и число токенов в нём
+def subtree_bounds(dtree):
+    first, last, count = dtree, dtree, 0
+    nodes = [dtree]
     while nodes:
         node = nodes.pop()
-        for key in filter(lambda x: not (x.startswith("_") or x.startswith("~")), node.keys()):
-            nodes.append(node[key])
-        if "_token" in node:
-            tokens.append(node["_token"])
-    for token in tokens:
-        token.pop("~included")
-        token.pop("~children")
-        token.pop("head_id")
-        token.pop("id")
-    return ctree
+        count += 1
+        if node["id"] < first["id"]:
+            first = node
+        if node["id"] > last["id"]:
+            last = node
+        nodes.extend(child for child in node["~children"] if not child["~included"])
+    return first, last, count
+
+
+# Части однородных и составных групп (однородные члены, части сложного предложения, части
+# предлога) построители записывают под промежуточными ключами part_key(номер, роль). При очистке
+# дерева части получают ключи вида "first-subject" (group_format="keys", не больше десяти частей)
+# или сохраняются по порядку в списке "parts" (group_format="list", число частей не ограничено)
+def part_key(ix, role):
+    return f"~part:{ix}:{role}"
+
+
+def clean_constituency_tree(ctree, group_format="keys"):
+    result = {}
+    nodes = [(ctree, result)]
+    while nodes:
+        node, copy = nodes.pop()
+        for key, value in node.items():
+            if key == "_token":
+                copy[key] = deepcopy({k: v for k, v in value.items()
+                                      if not (k.startswith("~") or k in {"head_id", "id"})})
+            elif key.startswith("~part:"):
+                _, ix, role = key.split(":", 2)
+                part = {}
+                if group_format == "list":
+                    copy.setdefault("parts", []).append(part)
+                else:
+                    copy[f"{_parts_names[int(ix)]}-{role}"] = part
+                nodes.append((value, part))
+            elif key.startswith("_") or key.startswith("~"):
+                copy[key] = deepcopy(value)
+            else:
+                copy[key] = {}
+                nodes.append((value, copy[key]))
+    return result
 
 
 def split_heterogeneous_conjunction_with_adversative(parts):
@@ -167,6 +341,9 @@ def split_heterogeneous_conjunction_with_adversative(parts):
 
 def collect_direct_speech_head_parts(dtree):
     opening_quote, closing_quote, border_tokens, indirect_speech = None, None, [], None
+    bounds = children_bounds(dtree)
+    if bounds is None or not has_punctuation_marks(dtree, "quotes", *bounds):
+        return indirect_speech, opening_quote, closing_quote, border_tokens
     for child in not_included_children(dtree, natural_order=True):
         if child["text"] in _opening_quotes:
             if opening_quote is None:
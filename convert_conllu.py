@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# Copyright © 2023 Anatoliy Poletaev, Ilya Paramonov, Elena Boychuk. All rights reserved.
+
+import argparse
+import json
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+
+from constituency_tree_builder.creator import dependency_tree_to_constituency_tree, conversion_stats, \
+    count_conversion
+from constituency_tree_builder.dependency_io import read_conllu
+from constituency_tree_builder.execution import Budget
+from constituency_tree_builder.utils import json_to_dependency_tree
+from morph_analyzer import add_sentence_tags, analyse_vocabulary, init_morphology, load_morphology_table, \
+    morphology_stats, sentence_tags
+
+
+def convert_sentence(sentence, group_format="keys", budget=None):
+    metadata, json_, tags = sentence
+    add_sentence_tags(tags)
+    result = {"sent_id": metadata.get("sent_id"), "text": metadata.get("text")}
+    try:
+        result["tree"] = dependency_tree_to_constituency_tree(json_to_dependency_tree(json_), group_format=group_format,
+                                                             budget=budget)
+        if result["tree"]["_type"] == "fallback":
+            result["fallback"] = result["tree"]["_reason"]
+    except Exception as e:
+        result["tree"] = None
+        result["error"] = repr(e)
+    return result
+
+
+def convert_sentences(sentences, workers=0, batch_size=2000, stats=None, group_format="keys", budget=None):
+    stats = {} if stats is None else stats
+    convert = partial(convert_sentence, group_format=group_format, budget=budget)
+    # Один пул процессов строит деревья и анализирует словари всех пакетов. Анализатор
+    # загружается до порождения процессов, поэтому они используют его словари совместно
+    executor = None
+    if workers > 0:
+        init_morphology()
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"),
+                                       initializer=init_morphology)
+    try:
+        # Предложения обрабатываются пакетами: морфологический анализ выполняется один раз
+        # для словаря пакета, а в памяти находится ограниченное число предложений
+        while batch := list(islice(sentences, batch_size)):
+            batch_stats = analyse_vocabulary([json_ for _, json_ in batch], workers, executor=executor)
+            for key, value in batch_stats.items():
+                stats[key] = stats.get(key, 0) + value
+            if executor is None:
+                yield from map(convert, [(metadata, json_, {}) for metadata, json_ in batch])
+            else:
+                tasks = [(metadata, json_, sentence_tags(json_)) for metadata, json_ in batch]
+                yield from executor.map(convert, tasks, chunksize=16)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a CoNLL-U treebank to constituency trees (JSON lines)")
+    parser.add_argument("input", help="CoNLL-U file, - for standard input")
+    parser.add_argument("output", nargs="?", default="-", help="JSON lines file, - for standard output")
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--morphology-table", help="table built by build_morphology_table.py")
+    parser.add_argument("--group-format", choices=["keys", "list"], default="keys",
+                        help="parts of homogeneous groups as first-/second-... keys or as an ordered list")
+    parser.add_argument("--max-steps", type=int, help="builder steps per sentence before a flat fallback tree")
+    parser.add_argument("--max-seconds", type=float, help="seconds per sentence before a flat fallback tree")
+    args = parser.parse_args()
+
+    if args.morphology_table is not None:
+        load_morphology_table(args.morphology_table)
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    target = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    budget = None if args.max_steps is None and args.max_seconds is None else Budget(args.max_steps, args.max_seconds)
+    converted = errors = 0
+    stats, conversion = {}, dict.fromkeys(conversion_stats, 0)
+    with source, target:
+        for result in convert_sentences(read_conllu(source), args.workers, stats=stats,
+                                        group_format=args.group_format, budget=budget):
+            target.write(json.dumps(result, ensure_ascii=False))
+            target.write("\n")
+            converted += 1
+            errors += "error" in result
+            # Счётчики рабочих процессов в родительский процесс не передаются, поэтому
+            # они подсчитываются здесь по результатам
+            if result["tree"] is not None:
+                count_conversion(conversion, result["tree"])
+    print(f"Converted {converted} sentences, errors: {errors}, "
+          f"fallback trees: {conversion['budget_exceeded'] + conversion['failed']} "
+          f"(budget exceeded: {conversion['budget_exceeded']}, failed: {conversion['failed']})", file=sys.stderr)
+    print(f"Morphology: {stats.get('tokens', 0)} tokens, {stats.get('vocabulary', 0)} words in batch vocabularies, "
+          f"{stats.get('table_hits', 0)} found in the morphology table, "
+          f"{stats.get('analysed', 0)} analysed with pymorphy2", file=sys.stderr)
+    requests = stats.get("table_hits", 0) + stats.get("analysed", 0)
+    if "table_size" in morphology_stats and requests:
+        print(f"Morphology table hit rate: {stats.get('table_hits', 0) / requests:.1%}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,122 +1,472 @@
 # Copyright © 2023 Anatoliy Poletaev, Ilya Paramonov, Elena Boychuk. All rights reserved.
 
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
 import stanza
 import ru_core_news_lg
+from spacy.attrs import ORTH, LEMMA, POS, MORPH, HEAD, DEP, IDX
 
 from natasha import Segmenter, MorphVocab, NewsEmbedding, NewsMorphTagger, \
         NewsSyntaxParser, NewsNERTagger, Doc
+from natasha.doc import DocToken, DocSent
+from razdel import tokenize as razdel_tokenize
+from spacy.tokens import Doc as SpacyDoc
+from stanza.models.common.doc import Document, ID, TEXT, MISC
 from stanza.pipeline.core import DownloadMethod
 
-stanza_model = stanza.Pipeline("ru", model_dir="./stanza_models",
-                               download_method=DownloadMethod.REUSE_RESOURCES)
-
-spacy_model = ru_core_news_lg.load()
-
-natasha_segmenter = Segmenter()
-natasha_morph_vocab = MorphVocab()
-natasha_emb = NewsEmbedding()
-natasha_morph_tagger = NewsMorphTagger(natasha_emb)
-natasha_syntax_parser = NewsSyntaxParser(natasha_emb)
-natasha_ner_tagger = NewsNERTagger(natasha_emb)
-
-
-def stanza_tree_repr(word, words):
-    spaces = 2
-    children = [w for w in words if w.head == word.id]
-    result = f"{word.deprel} - {word.text}"
-    if not children:
-        return result
-    for child in children:
-        child_tree_repr = stanza_tree_repr(child, words).strip().split('\n')
-        result += '\n'
-        result += '\n'.join(' ' * spaces + line for line in child_tree_repr)
-    return result
+from constituency_tree_builder.creator import dependency_tree_to_constituency_tree
+from constituency_tree_builder.dependency_io import tree_repr, parse_feats
+from constituency_tree_builder.utils import json_to_dependency_tree
+
+# Профили загрузки анализаторов. Построителю нужны только токены, леммы, UPOS,
+# вершины и типы связей, поэтому профиль minimal не загружает распознавание
+# именованных сущностей и другие неиспользуемые компоненты
+parser_profiles = {
+    "minimal": {
+        "stanza_processors": "tokenize,pos,lemma,depparse",
+        "spacy_exclude": ["ner", "senter"],
+        "natasha_ner": False
+    },
+    "full": {
+        "stanza_processors": "tokenize,pos,lemma,depparse,ner",
+        "spacy_exclude": [],
+        "natasha_ner": True
+    }
+}
+
+parser_profile = parser_profiles[os.environ.get("PARSER_PROFILE", "minimal")]
+
+# Загружаемые анализаторы; модели остальных анализаторов не загружаются
+parser_backends = set(os.environ.get("PARSER_BACKENDS", "stanza,spacy,natasha").split(","))
+
+stanza_model = None
+if "stanza" in parser_backends:
+    stanza_model = stanza.Pipeline("ru", model_dir="./stanza_models", processors=parser_profile["stanza_processors"],
+                                   download_method=DownloadMethod.REUSE_RESOURCES)
+
+spacy_model = None
+if "spacy" in parser_backends:
+    spacy_model = ru_core_news_lg.load(exclude=parser_profile["spacy_exclude"])
+
+natasha_segmenter = natasha_morph_vocab = natasha_emb = None
+natasha_morph_tagger = natasha_syntax_parser = natasha_ner_tagger = None
+if "natasha" in parser_backends:
+    natasha_segmenter = Segmenter()
+    natasha_morph_vocab = MorphVocab()
+    natasha_emb = NewsEmbedding()
+    natasha_morph_tagger = NewsMorphTagger(natasha_emb)
+    natasha_syntax_parser = NewsSyntaxParser(natasha_emb)
+    natasha_ner_tagger = NewsNERTagger(natasha_emb) if parser_profile["natasha_ner"] else None
+
+
+# Предложение передаётся анализаторам либо строкой, либо списком токенов. Список токенов
+# не токенизируется повторно, номера токенов в результате совпадают с их позициями в списке
+def pretokenized_text(tokens):
+    starts, position = [], 0
+    for token in tokens:
+        starts.append(position)
+        position += len(token) + 1
+    return " ".join(tokens), starts
+
+
+def stanza_doc(sentence):
+    if isinstance(sentence, str):
+        return stanza_model(sentence)
+    # Документ строится так же, как при tokenize_pretokenized, и обрабатывается
+    # всеми процессорами конвейера, кроме токенизатора
+    text, starts = pretokenized_text(sentence)
+    doc = Document([[{ID: (ix + 1,), TEXT: token, MISC: f"start_char={start}|end_char={start + len(token)}"}
+                     for ix, (token, start) in enumerate(zip(sentence, starts))]], text)
+    processors = [x for x in parser_profile["stanza_processors"].split(",") if x != "tokenize"]
+    return stanza_model(doc, processors=processors)
 
 
 def stanza_parse(sentence):
-    words = stanza_model(sentence).sentences[0].words
-    root = next(filter(lambda x: x.deprel == "root", words))
-    return stanza_tree_repr(root, words)
+    return tree_repr(stanza_json(sentence))
 
 
 def stanza_json(sentence):
-    words = stanza_model(sentence).sentences[0].words
-    return [{"id": word.id - 1,
-             "text": word.text,
-             "lemma": word.lemma,
-             "pos": word.upos.upper(),
-             "head_id": word.head - 1,
-             "deprel": word.deprel.lower()}
-            for word in words]
-
-
-def spacy_tree_repr(token):
-    spaces = 2
-    result = f"{token.dep_.lower()} - {token.text}"
-    if not token.children:
-        return result
-    for child in token.children:
-        child_tree_repr = spacy_tree_repr(child).strip().split('\n')
-        result += '\n'
-        result += '\n'.join(' ' * spaces + line for line in child_tree_repr)
+    return stanza_doc_json(stanza_doc(sentence))[0]
+
+
+# Преобразование документа Stanza в списки словарей токенов по предложениям.
+# Используется представление документа в виде словарей, а не объекты Word,
+# приведение регистра выполняется один раз для каждого различного значения
+def stanza_doc_json(doc, offsets=False):
+    upper, lower, feats = {}, {}, {}
+    result = []
+    for sentence in doc.to_dict():
+        json_ = []
+        span = None, None
+        for entry in sentence:
+            if type(entry["id"]) is not int:
+                # Многословный токен: позиции есть только у него, а не у составляющих его слов
+                span = entry.get("start_char"), entry.get("end_char")
+                continue
+            pos, deprel, word_feats = entry["upos"], entry["deprel"], entry.get("feats", "_")
+            if word_feats not in feats:
+                feats[word_feats] = parse_feats(word_feats)
+            word = {"id": entry["id"] - 1,
+                    "text": entry["text"],
+                    "lemma": entry.get("lemma"),
+                    "pos": upper.get(pos) or upper.setdefault(pos, pos.upper()),
+                    "head_id": entry["head"] - 1,
+                    "deprel": lower.get(deprel) or lower.setdefault(deprel, deprel.lower()),
+                    "feats": dict(feats[word_feats]) if feats[word_feats] else None}
+            if offsets:
+                word["start"] = entry.get("start_char", span[0])
+                word["stop"] = entry.get("end_char", span[1])
+            json_.append(word)
+        result.append(json_)
     return result
 
 
+def spacy_doc(sentence):
+    if isinstance(sentence, str):
+        return spacy_model(sentence)
+    return spacy_model(SpacyDoc(spacy_model.vocab, words=sentence))
+
+
 def spacy_parse(sentence):
-    doc = spacy_model(sentence)
-    root = next(filter(lambda x: x.dep_ == "ROOT", doc))
-    return spacy_tree_repr(root)
+    return tree_repr(spacy_json(sentence))
 
 
 def spacy_json(sentence):
-    doc = spacy_model(sentence)
-    return [{"id": word.i,
-             "text": word.text,
-             "lemma": word.lemma_,
-             "pos": word.pos_.upper(),
-             "head_id": word.head.i,
-             "deprel": word.dep_.lower()}
-            for word in doc]
-
-
-def natasha_tree_repr(token, doc):
-    spaces = 2
-    children = [t for t in doc.tokens if t.head_id == token.id]
-    result = f"{token.rel} - {token.text}"
-    if not children:
-        return result
-    for child in children:
-        child_tree_repr = natasha_tree_repr(child, doc).strip().split('\n')
-        result += '\n'
-        result += '\n'.join(' ' * spaces + line for line in child_tree_repr)
+    doc = spacy_doc(sentence)
+    return spacy_doc_json(doc, [(0, len(doc))])[0]
+
+
+spacy_attributes = [ORTH, LEMMA, POS, MORPH, HEAD, DEP, IDX]
+
+
+# Преобразование документа spaCy в списки словарей токенов по предложениям (spans -
+# границы предложений в токенах, по умолчанию doc.sents). Атрибуты извлекаются одним
+# массивом, строки берутся из хранилища строк один раз для каждого различного хеша
+def spacy_doc_json(doc, spans=None, offsets=False):
+    if spans is None:
+        spans = [(sentence.start, sentence.end) for sentence in doc.sents]
+    strings = doc.vocab.strings
+    array = doc.to_array(spacy_attributes)
+    orths, lemmas, poses, morphs, _, deps, idxs = array.T.tolist()
+    # Смещения до вершины отрицательны, а массив беззнаковый
+    heads = array[:, spacy_attributes.index(HEAD)].astype("int64").tolist()
+    texts = {hash_: strings[hash_] for hash_ in set(orths) | set(lemmas)}
+    poses_ = {hash_: strings[hash_].upper() for hash_ in set(poses)}
+    deps_ = {hash_: strings[hash_].lower() for hash_ in set(deps)}
+    feats = {hash_: parse_feats(strings[hash_]) for hash_ in set(morphs)}
+    result = []
+    for start, end in spans:
+        json_ = []
+        for i in range(start, end):
+            text = texts[orths[i]]
+            word = {"id": i - start,
+                    "text": text,
+                    "lemma": texts[lemmas[i]],
+                    "pos": poses_[poses[i]],
+                    "head_id": i + heads[i] - start,
+                    "deprel": deps_[deps[i]],
+                    "feats": dict(feats[morphs[i]]) if feats[morphs[i]] else None}
+            if offsets:
+                word["start"] = idxs[i]
+                word["stop"] = idxs[i] + len(text)
+            json_.append(word)
+        result.append(json_)
     return result
 
 
-def natasha_parse(sentence):
-    doc = Doc(sentence)
-    doc.segment(natasha_segmenter)
+def natasha_doc(sentence):
+    if isinstance(sentence, str):
+        doc = Doc(sentence)
+        doc.segment(natasha_segmenter)
+    else:
+        text, starts = pretokenized_text(sentence)
+        doc = Doc(text)
+        doc.tokens = [DocToken(start, start + len(token), token) for token, start in zip(sentence, starts)]
+        doc.sents = [DocSent(0, len(text), text)]
+        doc.envelop_sent_tokens()
     doc.tag_morph(natasha_morph_tagger)
     for token in doc.tokens:
         token.lemmatize(natasha_morph_vocab)
     doc.parse_syntax(natasha_syntax_parser)
-    try:
-        root = next(filter(lambda x: x.rel == "root", doc.tokens))
-    except StopIteration:
+    return doc
+
+
+def natasha_parse(sentence):
+    doc = natasha_doc(sentence)
+    json_ = natasha_doc_json(doc)[0]
+    # Если корня нет, токены перечисляются с исходными идентификаторами Natasha вида "1_3"
+    if not any(word["deprel"] == "root" for word in json_):
         return '\n'.join([f"{t.id}, {t.text}, {t.head_id}, {t.rel}" for t in doc.tokens])
-    return natasha_tree_repr(root, doc)
+    return tree_repr(json_)
 
 
 def natasha_json(sentence):
-    doc = Doc(sentence)
-    doc.segment(natasha_segmenter)
-    doc.tag_morph(natasha_morph_tagger)
-    for token in doc.tokens:
-        token.lemmatize(natasha_morph_vocab)
-    doc.parse_syntax(natasha_syntax_parser)
-    return [{"id": int(word.id.split('_')[1]) - 1,
-             "text": word.text,
-             "lemma": word.lemma,
-             "pos": word.pos.upper(),
-             "head_id": int(word.head_id.split('_')[1]) - 1,
-             "deprel": word.rel.lower()}
-            for word in doc.tokens]
+    doc = natasha_doc(sentence)
+    return [word for sentence in natasha_doc_json(doc) for word in sentence]
+
+
+# Преобразование документа Natasha в списки словарей токенов по предложениям.
+# Номера токенов берутся из их позиций в предложении, а не из разбора строковых идентификаторов
+def natasha_doc_json(doc, offsets=False):
+    upper, lower = {}, {}
+    result = []
+    for sentence in doc.sents:
+        ids = {token.id: ix for ix, token in enumerate(sentence.tokens)}
+        json_ = []
+        for ix, token in enumerate(sentence.tokens):
+            pos, rel = token.pos, token.rel
+            word = {"id": ix,
+                    "text": token.text,
+                    "lemma": token.lemma,
+                    "pos": upper.get(pos) or upper.setdefault(pos, pos.upper()),
+                    "head_id": ids.get(token.head_id, -1),
+                    "deprel": lower.get(rel) or lower.setdefault(rel, rel.lower()),
+                    "feats": dict(token.feats) if token.feats else None}
+            if offsets:
+                word["start"] = token.start
+                word["stop"] = token.stop
+            json_.append(word)
+        result.append(json_)
+    return result
+
+
+json_parsers = {
+    "stanza": stanza_json,
+    "spacy": spacy_json,
+    "natasha": natasha_json
+}
+
+# Анализаторы в порядке приоритета: при равенстве голосов выбирается вариант первого из них
+concurrent_backends = [name for name in json_parsers if name in parser_backends]
+
+# У каждого анализатора свой поток, поэтому задания медленного анализатора не занимают потоки
+# остальных. Последнее задание каждого анализатора запоминается в backend_jobs
+backend_executors = {name: ThreadPoolExecutor(1, thread_name_prefix=f"parser-{name}") for name in json_parsers}
+backend_jobs = {}
+backend_jobs_lock = threading.Lock()
+
+
+def is_backend_busy(name):
+    job = backend_jobs.get(name)
+    return job is not None and not job.done()
+
+
+# Одновременный разбор предложения всеми анализаторами. В режиме first возвращается результат
+# анализатора, закончившего первым, в режиме vote - дерево, полученное голосованием по связям.
+# Предложение предварительно токенизируется, чтобы токены всех анализаторов совпадали.
+# Возвращается список токенов и список анализаторов, результаты которых использованы.
+# В режиме first анализаторы, ещё не закончившие предыдущее задание, пропускаются, если есть
+# свободные, а после получения результата ожидающие задания отменяются: запущенное задание
+# прервать нельзя, но за ним не накапливаются задания уже обработанных запросов
+def concurrent_json(sentence, mode="first", backends=None):
+    backends = backends or concurrent_backends
+    if mode not in {"first", "vote"}:
+        raise ValueError(f"Unknown mode: {mode}")
+    tokens = sentence if not isinstance(sentence, str) else [token.text for token in razdel_tokenize(sentence)]
+    with backend_jobs_lock:
+        if mode == "first":
+            backends = [name for name in backends if not is_backend_busy(name)] or backends
+        futures = {}
+        for name in backends:
+            future = backend_executors[name].submit(json_parsers[name], tokens)
+            backend_jobs[name] = future
+            futures[future] = name
+    if mode == "first":
+        pending, error = set(futures), None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        return future.result(), [futures[future]]
+                    error = future.exception()
+        finally:
+            for future in futures:
+                future.cancel()
+        raise error
+    wait(futures)
+    results = [(name, future.result()) for future, name in futures.items()
+               if future.exception() is None and len(future.result()) == len(tokens)]
+    results.sort(key=lambda x: backends.index(x[0]))
+    if not results:
+        raise ValueError(f"No parser produced a tree for: {tokens}")
+    return vote_json([json_ for _, json_ in results]), [name for name, _ in results]
+
+
+def vote_json(jsons):
+    size = len(jsons[0])
+    # Вес связи - число проголосовавших за неё анализаторов; добавка, убывающая с номером
+    # анализатора и в сумме меньшая единицы, разрешает равенство голосов по приоритету
+    scores = {dependent: {head: 0 for head in range(size + 1) if head != dependent}
+              for dependent in range(1, size + 1)}
+    votes = [{} for _ in range(size)]
+    for priority, json_ in enumerate(jsons):
+        for word in json_:
+            head = word["head_id"]
+            head = -1 if head == word["id"] or word["deprel"] == "root" else head
+            scores[word["id"] + 1][head + 1] += 1 + 0.5 ** (priority + 2)
+            votes[word["id"]].setdefault(head, []).append(word)
+    # Корень выбирается перебором: для каждого кандидата строится остовное дерево
+    # максимального веса, в котором из фиктивного корня выходит только одна связь
+    best_heads, best_score = None, None
+    candidates = [dependent for dependent in scores if scores[dependent][0] > 0] or list(scores)
+    for root in candidates:
+        restricted = {dependent: {head: weight for head, weight in heads.items() if head or dependent == root}
+                      for dependent, heads in scores.items()}
+        heads = maximum_spanning_arborescence(restricted, 0)
+        score = sum(scores[dependent][head] for dependent, head in heads.items())
+        if best_score is None or score > best_score:
+            best_heads, best_score = heads, score
+    result = []
+    for ix in range(size):
+        head = best_heads[ix + 1] - 1
+        words = votes[ix].get(head, [])
+        deprels = [word["deprel"] for word in words]
+        if head == -1:
+            deprel = "root"
+        else:
+            deprels = [deprel for deprel in deprels if deprel != "root"]
+            deprel = Counter(deprels).most_common(1)[0][0] if deprels else "dep"
+        poses = Counter(json_[ix]["pos"] for json_ in jsons)
+        result.append({"id": ix,
+                       "text": jsons[0][ix]["text"],
+                       "lemma": jsons[0][ix]["lemma"],
+                       "feats": jsons[0][ix].get("feats"),
+                       "pos": poses.most_common(1)[0][0],
+                       "head_id": head,
+                       "deprel": deprel})
+    return result
+
+
+# Алгоритм Чу-Лю-Эдмондса: scores[dependent][head] - вес связи, результат - вершина каждого узла
+def maximum_spanning_arborescence(scores, root):
+    heads = {dependent: max(candidates, key=candidates.get) for dependent, candidates in scores.items()}
+    cycle = find_cycle(heads)
+    if cycle is None:
+        return heads
+    contracted = max(set(scores) | {root}) + 1
+    contracted_scores, entering, leaving = {contracted: {}}, {}, {}
+    for dependent, candidates in scores.items():
+        for head, weight in candidates.items():
+            if dependent in cycle and head not in cycle:
+                weight -= scores[dependent][heads[dependent]]
+                if weight > contracted_scores[contracted].get(head, float("-inf")):
+                    contracted_scores[contracted][head] = weight
+                    entering[head] = dependent
+            elif dependent not in cycle and head in cycle:
+                if weight > contracted_scores.setdefault(dependent, {}).get(contracted, float("-inf")):
+                    contracted_scores[dependent][contracted] = weight
+                    leaving[dependent] = head
+            elif dependent not in cycle:
+                contracted_scores.setdefault(dependent, {})[head] = weight
+    result = {}
+    for dependent, head in maximum_spanning_arborescence(contracted_scores, root).items():
+        if dependent == contracted:
+            result[entering[head]] = head
+        elif head == contracted:
+            result[dependent] = leaving[dependent]
+        else:
+            result[dependent] = head
+    for dependent in cycle:
+        result.setdefault(dependent, heads[dependent])
+    return result
+
+
+def find_cycle(heads):
+    visited = set()
+    for start in heads:
+        path, node = [], start
+        while node in heads and node not in visited:
+            visited.add(node)
+            path.append(node)
+            node = heads[node]
+        if node in path:
+            return set(path[path.index(node):])
+    return None
+
+
+# Предложения для прогрева анализаторов: первый разбор после загрузки модели выполняется
+# значительно дольше последующих из-за отложенной инициализации torch и выделения памяти
+warm_up_sentences = [
+    "Мама мыла раму.",
+    "Вчера вечером мы долго гуляли по старому парку у реки.",
+    "Он сказал, что придёт завтра, если не будет дождя.",
+    "Книга, которую я купил в маленьком магазине на углу, оказалась интересной.",
+    "Студенты, преподаватели и гости университета собрались в большом зале, чтобы послушать доклад "
+    "известного учёного о новых методах анализа текстов на русском языке."
+]
+
+warm_up_tokens = sum(len(list(razdel_tokenize(sentence))) for sentence in warm_up_sentences)
+
+# Результаты прогрева: время разбора и построения дерева для образцов при первом
+# (cold) и повторном (warm) проходе, в секундах
+warm_up_timings = {}
+
+backend_ready = {name: False for name in json_parsers}
+
+# Устанавливается, когда все загруженные анализаторы прогреты; сервис может принимать запросы
+parsers_ready = threading.Event()
+
+
+def warm_up(backends=None, rounds=2):
+    backends = backends or concurrent_backends
+    for name in backends:
+        parse = json_parsers[name]
+        timings = []
+        for _ in range(max(rounds, 2)):
+            start = time.perf_counter()
+            for sentence in warm_up_sentences:
+                dependency_tree_to_constituency_tree(json_to_dependency_tree(parse(sentence)))
+            timings.append(time.perf_counter() - start)
+        warm_up_timings[name] = {"cold": timings[0], "warm": min(timings[1:])}
+        seconds_per_token[name] = warm_up_timings[name]["warm"] / warm_up_tokens
+        backend_ready[name] = True
+    if all(backend_ready[name] for name in concurrent_backends):
+        parsers_ready.set()
+    return warm_up_timings
+
+
+# Пороги маршрутизации по длине предложения: выбирается первый загруженный анализатор,
+# порог которого (число токенов, None - без ограничения) не меньше длины предложения
+routing_thresholds = [(150, "stanza"), (400, "spacy"), (None, "natasha")]
+
+# Оценка времени разбора одного токена каждым анализатором в секундах. Начальное значение
+# задаётся прогревом, затем оценка уточняется по фактическому времени разбора
+seconds_per_token = {}
+seconds_per_token_smoothing = 0.1
+
+
+# Разбор предложения анализатором, выбранным по длине предложения и допустимому времени
+# разбора (latency_budget, в секундах). Если предполагаемое время разбора выбранным по длине
+# анализатором превышает допустимое, используется следующий анализатор, укладывающийся в него,
+# а если таких нет - самый быстрый. Возвращается список токенов и сведения о разборе
+def routed_json(sentence, latency_budget=None, thresholds=None):
+    thresholds = thresholds or routing_thresholds
+    tokens = sentence if not isinstance(sentence, str) else [token.text for token in razdel_tokenize(sentence)]
+    loaded = [(limit, name) for limit, name in thresholds if name in parser_backends]
+    if not loaded:
+        raise ValueError(f"None of the routed parsers is loaded: {[name for _, name in thresholds]}")
+    admitted = [name for limit, name in loaded if limit is None or len(tokens) <= limit]
+    candidates = admitted + [name for _, name in loaded if name not in admitted]
+    estimates = {name: seconds_per_token[name] * len(tokens) for name in candidates if name in seconds_per_token}
+    backend = candidates[0]
+    if latency_budget is not None:
+        within_budget = [name for name in candidates if estimates.get(name, 0) <= latency_budget]
+        backend = within_budget[0] if within_budget else min(estimates, key=estimates.get)
+    start = time.perf_counter()
+    json_ = json_parsers[backend](tokens)
+    elapsed = time.perf_counter() - start
+    if tokens:
+        observed = elapsed / len(tokens)
+        previous = seconds_per_token.get(backend, observed)
+        seconds_per_token[backend] = previous + seconds_per_token_smoothing * (observed - previous)
+    return json_, {
+        "backend": backend,
+        "tokens": len(tokens),
+        "estimated": estimates.get(backend),
+        "elapsed": elapsed
+    }
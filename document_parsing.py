@@ -0,0 +1,201 @@
+# Copyright © 2023 Anatoliy Poletaev, Ilya Paramonov, Elena Boychuk. All rights reserved.
+
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+from functools import partial
+from itertools import islice
+
+from razdel import sentenize
+from stanza.models.common.doc import Document
+
+from dependency_parsing import stanza_model, spacy_model, natasha_doc, stanza_doc_json, spacy_doc_json, \
+    natasha_doc_json
+from constituency_tree_builder.creator import dependency_tree_to_constituency_tree, count_conversion
+from constituency_tree_builder.utils import json_to_dependency_tree
+
+
+def razdel_sentences(text):
+    return [(sentence.start, sentence.stop) for sentence in sentenize(text)]
+
+
+def stanza_sentences(text):
+    return [(sentence.tokens[0].start_char, sentence.tokens[-1].end_char)
+            for sentence in stanza_model(text, processors="tokenize").sentences]
+
+
+def spacy_sentences(text):
+    with spacy_model.select_pipes(enable=["tok2vec", "parser"]):
+        doc = spacy_model(text)
+    return [(sentence.start_char, sentence.end_char) for sentence in doc.sents]
+
+
+segmenters = {
+    "razdel": razdel_sentences,
+    "stanza": stanza_sentences,
+    "spacy": spacy_sentences
+}
+
+
+def read_chunks(source, chunk_size):
+    if isinstance(source, str):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+    elif hasattr(source, "read"):
+        yield from iter(lambda: source.read(chunk_size), "")
+    else:
+        yield from source
+
+
+# Перекрытие с уже разбитым текстом, с которого начинается разбиение хвоста буфера
+segmentation_overlap = 1000
+
+
+# Части длинного текста без границ предложений не длиннее max_sentence_size, по возможности
+# до пробела, и начало оставшегося текста, который короче max_sentence_size
+def cut_long_sentence(text, max_sentence_size):
+    parts, start = [], 0
+    while len(text) - start >= max_sentence_size:
+        cut = text.rfind(" ", start, start + max_sentence_size)
+        if cut <= start:
+            cut = start + max_sentence_size
+        parts.append((start, cut))
+        start = cut
+    return parts, start
+
+
+def stream_sentences(source, segmenter="razdel", buffer_size=65536, max_sentence_size=2 ** 20):
+    split = segmenters[segmenter]
+    # После первого разбиения буфер начинается с незаконченного предложения; текст
+    # до checked уже разбит, и других границ предложений в нём нет
+    buffer, offset, checked = "", 0, 0
+    for chunk in read_chunks(source, buffer_size):
+        buffer += chunk
+        if len(buffer) - checked < buffer_size:
+            continue
+        # Заново разбивается только хвост буфера с небольшим перекрытием, начинающимся с пробела;
+        # первая часть хвоста продолжает незаконченное предложение
+        start = 0
+        if checked > segmentation_overlap:
+            start = buffer.rfind(" ", 0, checked - segmentation_overlap) + 1 or checked - segmentation_overlap
+        spans = [(start + span_start, start + span_stop) for span_start, span_stop in split(buffer[start:])]
+        checked = len(buffer)
+        if not spans:
+            if start == 0:
+                buffer, offset, checked = "", offset + len(buffer), 0
+            continue
+        if start > 0:
+            spans[0] = (0, spans[0][1])
+        # Последнее предложение буфера может продолжаться в следующем фрагменте,
+        # поэтому оно остаётся в буфере до следующего разбиения
+        for span_start, span_stop in spans[:-1]:
+            yield offset + span_start, offset + span_stop, buffer[span_start:span_stop]
+        rest = spans[-1][0]
+        buffer, offset, checked = buffer[rest:], offset + rest, checked - rest
+        # Текст без границ предложений не накапливается без ограничения: слишком длинное
+        # незаконченное предложение выдаётся частями
+        parts, rest = cut_long_sentence(buffer, max_sentence_size)
+        for part_start, part_stop in parts:
+            yield offset + part_start, offset + part_stop, buffer[part_start:part_stop]
+        if parts:
+            buffer, offset, checked = buffer[rest:], offset + rest, 0
+    if buffer.strip():
+        spans = split(buffer)
+        if spans:
+            last_start, last_stop = spans[-1]
+            parts, rest = cut_long_sentence(buffer[last_start:last_stop], max_sentence_size)
+            parts.append((rest, last_stop - last_start))
+            spans[-1:] = [(last_start + part_start, last_start + part_stop) for part_start, part_stop in parts
+                          if part_start < part_stop]
+        for start, stop in spans:
+            yield offset + start, offset + stop, buffer[start:stop]
+
+
+# Разборщики пакета текстов: для каждого текста возвращается список предложений,
+# которые выделил в нём анализатор, с позициями токенов относительно начала текста
+
+def stanza_parse_batch(texts):
+    docs = stanza_model([Document([], text=text) for text in texts])
+    return [stanza_doc_json(doc, offsets=True) for doc in docs]
+
+
+def spacy_parse_batch(texts):
+    return [spacy_doc_json(doc, offsets=True) for doc in spacy_model.pipe(texts, batch_size=len(texts))]
+
+
+def natasha_parse_batch(texts):
+    return [natasha_doc_json(natasha_doc(text), offsets=True) for text in texts]
+
+
+batch_parsers = {
+    "stanza": stanza_parse_batch,
+    "spacy": spacy_parse_batch,
+    "natasha": natasha_parse_batch
+}
+
+
+def convert_sentence(json_, budget=None):
+    try:
+        return dependency_tree_to_constituency_tree(json_to_dependency_tree(deepcopy(json_)), budget=budget), None
+    except Exception as e:
+        return None, repr(e)
+
+
+def parse_sentences(batch, parse_batch):
+    sentences = []
+    for (offset, _, text), parsed in zip(batch, parse_batch([text for _, _, text in batch])):
+        for json_ in parsed:
+            if not json_:
+                continue
+            for token in json_:
+                token["start"] += offset
+                token["stop"] += offset
+            start, stop = json_[0]["start"], json_[-1]["stop"]
+            sentences.append({
+                "start": start,
+                "stop": stop,
+                "text": text[start - offset:stop - offset],
+                "tokens": json_
+            })
+    return sentences
+
+
+def process_document(source, parser="stanza", segmenter="razdel", batch_size=32, workers=None,
+                     buffer_size=65536, budget=None, stats=None, max_sentence_size=2 ** 20):
+    parse_batch = batch_parsers[parser]
+    convert = partial(convert_sentence, budget=budget)
+    sentences = stream_sentences(source, segmenter, buffer_size, max_sentence_size)
+
+    def finish(pending):
+        parsed, trees = pending
+        for sentence, (tree, error) in zip(parsed, trees):
+            sentence["tree"] = tree
+            if error is not None:
+                sentence["error"] = error
+            elif tree["_type"] == "fallback":
+                sentence["fallback"] = tree["_reason"]
+            # Деревья строятся в рабочих процессах, поэтому счётчики (stats, с ключами
+            # conversion_stats) ведутся здесь по возвращённым деревьям
+            if tree is not None and stats is not None:
+                count_conversion(stats, tree)
+            yield sentence
+
+    # Деревья составляющих строятся в дочерних процессах, пока основной процесс
+    # разбирает следующий пакет предложений; в работе одновременно не больше двух пакетов
+    executor = None if workers == 0 else \
+        ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"))
+    try:
+        pending = deque()
+        while batch := list(islice(sentences, batch_size)):
+            parsed = parse_sentences(batch, parse_batch)
+            jsons = [sentence["tokens"] for sentence in parsed]
+            trees = map(convert, jsons) if executor is None else executor.map(convert, jsons)
+            pending.append((parsed, trees))
+            if len(pending) > 1:
+                yield from finish(pending.popleft())
+        while pending:
+            yield from finish(pending.popleft())
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
@@ -3,12 +3,13 @@
 
 from pprint import pprint
 
-from dependency_parsing import stanza_json
+from dependency_parsing import stanza_json, warm_up
 from constituency_tree_builder.creator import dependency_tree_to_constituency_tree
 from constituency_tree_builder.utils import json_to_dependency_tree
 
 
 def main():
+    warm_up(["stanza"])
     while True:
         try:
             sentence = input("Sentence:\n> ")
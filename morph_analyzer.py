@@ -1,8 +1,59 @@
 # Copyright © 2023 Anatoliy Poletaev, Ilya Paramonov, Elena Boychuk. All rights reserved.
 
+import json
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 from pymorphy2 import MorphAnalyzer
 
-morph = MorphAnalyzer()
+# Анализатор создаётся при первом обращении, а не при импорте: загрузка словарей pymorphy2
+# не нужна тем, кто не использует морфологию. Чтобы рабочие процессы использовали словари
+# совместно, init_morphology() можно вызвать в родительском процессе до их порождения
+morph = None
+
+morphology_stats = {}
+
+# Результаты pymorphy2 по ключу (текст, лемма, часть речи). При превышении размера кэш очищается
+tags_cache = {}
+tags_cache_limit = 500000
+
+# Таблица заранее вычисленных результатов pymorphy2 для частых слов (см. build_morphology_table.py).
+# Файл отображается в память только для чтения, поэтому процессы используют его страницы совместно.
+# Путь к таблице задаётся переменной окружения MORPHOLOGY_TABLE или функцией load_morphology_table
+morphology_table = None
+morphology_table_path = os.environ.get("MORPHOLOGY_TABLE")
+
+# Формат таблицы: заголовок (сигнатура, число записей, длина списка граммем), список граммем
+# в JSON, смещения ключей, записи признаков (номера граммем и признак географического объекта)
+# и отсортированные ключи "текст\0лемма\0часть речи" в UTF-8
+_table_signature = b"MRPH"
+_table_header = struct.Struct("<4sII")
+_table_offset = struct.Struct("<I")
+_table_fields = ["pos", "gender", "person", "tense", "number", "case"]
+_table_record = struct.Struct(f"<{len(_table_fields) + 1}B")
+
+
+def resident_memory():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def init_morphology():
+    global morph
+    if morph is None:
+        memory, start = resident_memory(), time.perf_counter()
+        morph = MorphAnalyzer()
+        morphology_stats["load_time"] = time.perf_counter() - start
+        morphology_stats["memory"] = None if memory is None else resident_memory() - memory
+        morphology_stats["pid"] = os.getpid()
+    return morphology_stats
 
 
 def has_same_tense(first_verb_tags, second_verb_tags):
@@ -17,29 +68,146 @@ def has_same_person(first_verb_tags, second_verb_tags):
     return first_verb_tags["person"] == second_verb_tags["person"]
 
 
-def get_tags(text, lemma, pos):
+# Соответствие универсальных частей речи (UPOS) частям речи OpenCorpora, которые возвращает pymorphy2
+_ud_pos = {
+    "NOUN": "NOUN",
+    "PROPN": "NOUN",
+    "ADJ": "ADJF",
+    "DET": "ADJF",
+    "PRON": "NPRO",
+    "NUM": "NUMR",
+    "ADV": "ADVB",
+    "ADP": "PREP",
+    "CCONJ": "CONJ",
+    "SCONJ": "CONJ",
+    "PART": "PRCL",
+    "INTJ": "INTJ",
+    "VERB": "VERB",
+    "AUX": "VERB"
+}
+
+_ud_verb_forms = {
+    "Fin": "VERB",
+    "Inf": "INFN",
+    "Part": "PRTF",
+    "Conv": "GRND"
+}
+
+_ud_short_forms = {
+    "ADJF": "ADJS",
+    "PRTF": "PRTS"
+}
+
+_ud_gender = {"Masc": "masc", "Fem": "femn", "Neut": "neut"}
+
+_ud_person = {"1": "1per", "2": "2per", "3": "3per"}
+
+_ud_tense = {"Past": "past", "Pres": "pres", "Fut": "futr"}
+
+_ud_number = {"Sing": "sing", "Plur": "plur"}
+
+_ud_case = {
+    "Nom": "nomn",
+    "Gen": "gent",
+    "Par": "gen2",
+    "Dat": "datv",
+    "Acc": "accs",
+    "Ins": "ablt",
+    "Loc": "loct",
+    "Voc": "voct"
+}
+
+
+# Признаки UD, без которых проверкам не хватает сведений о слове: для глаголов - форма
+# (деепричастие, инфинитив, причастие), для именных частей речи - падеж
+_ud_required_feats = {
+    "VERB": ["VerbForm"],
+    "AUX": ["VerbForm"],
+    "NOUN": ["Case"],
+    "PROPN": ["Case"],
+    "PRON": ["Case"],
+    "ADJ": ["Case"]
+}
+
+
+def has_ud_feats(pos, feats):
+    return bool(feats) and all(feat in feats for feat in _ud_required_feats.get(pos, ()))
+
+
+def get_tags(text, lemma, pos, feats=None):
+    # Если анализатор синтаксических связей выдал морфологические признаки UD, нужные
+    # для части речи, используются они, а pymorphy2 не вызывается
+    if has_ud_feats(pos, feats):
+        return get_ud_tags(text, lemma, pos, feats)
+    key = (text, lemma, pos)
+    tags = tags_cache.get(key)
+    if tags is None:
+        if len(tags_cache) >= tags_cache_limit:
+            tags_cache.clear()
+        tags = get_table_tags(key)
+        if tags is None:
+            tags = get_pymorphy_tags(text, lemma, pos)
+        tags_cache[key] = tags
+    return tags
+
+
+def get_pymorphy_tags(text, lemma, pos):
     parse = parse_word(text, lemma, pos)
     return {
-        "pos": parse.tag.POS,
-        "gender": parse.tag.gender,
-        "person": parse.tag.person,
-        "tense": parse.tag.tense,
-        "number": parse.tag.number,
+        "pos": grammeme(parse.tag.POS),
+        "gender": grammeme(parse.tag.gender),
+        "person": grammeme(parse.tag.person),
+        "tense": grammeme(parse.tag.tense),
+        "number": grammeme(parse.tag.number),
         "is_geox": ("Geox" in parse.tag.grammemes),
-        "case": parse.tag.case
+        "case": grammeme(parse.tag.case)
     }
 
 
-def is_plur_number(text, lemma, pos):
-    return get_tags(text, lemma, pos)["number"] == "plur"
+# Граммемы pymorphy2 - экземпляры локальных подклассов str, которые нельзя передать
+# в другой процесс, поэтому в кэше хранятся обычные строки
+def grammeme(value):
+    return None if value is None else str(value)
+
+
+def get_ud_tags(text, lemma, pos, feats):
+    ud_pos = _ud_pos.get(pos)
+    if ud_pos == "VERB":
+        ud_pos = _ud_verb_forms.get(feats.get("VerbForm"), "VERB")
+    elif ud_pos == "NUMR" and text.isdigit():
+        ud_pos = None
+    if feats.get("Variant") == "Short":
+        ud_pos = _ud_short_forms.get(ud_pos, ud_pos)
+    if feats.get("Degree") == "Cmp" and ud_pos in {"ADJF", "ADVB", "NUMR"}:
+        ud_pos = "COMP"
+    return {
+        "pos": ud_pos,
+        "gender": _ud_gender.get(feats.get("Gender")),
+        "person": _ud_person.get(feats.get("Person")),
+        "tense": _ud_tense.get(feats.get("Tense")),
+        "number": _ud_number.get(feats.get("Number")),
+        # В UD нет признака географического объекта, поэтому для имён собственных он берётся из pymorphy2
+        "is_geox": needs_geox_check(text, pos) and get_tags(text, lemma, pos)["is_geox"],
+        "case": _ud_case.get(feats.get("Case"))
+    }
+
+
+def needs_geox_check(text, pos):
+    return pos in {"PROPN", "NOUN"} and text[:1].isupper()
+
 
+def is_plur_number(text, lemma, pos, feats=None):
+    return get_tags(text, lemma, pos, feats)["number"] == "plur"
 
-def is_geographical_object(text, lemma, pos):
-    tags = get_tags(text, lemma, pos)
+
+def is_geographical_object(text, lemma, pos, feats=None):
+    tags = get_tags(text, lemma, pos, feats)
     return tags["is_geox"]
 
 
 def parse_word(text, lemma, pos):
+    if morph is None:
+        init_morphology()
     parse = morph.parse(text)
     if len(parse) == 1:
         return parse[0]
@@ -49,3 +217,164 @@ def parse_word(text, lemma, pos):
         if candidate.normal_form == lemma and candidate.tag.POS.lower() == pos.lower():
             return candidate
     return parse[0]
+
+
+# Пакетный морфологический анализ: каждое различное сочетание (текст, лемма, часть речи)
+# в пакете предложений анализируется pymorphy2 один раз, результаты попадают в кэш и
+# используются всеми предложениями. Большой словарь распределяется по процессам
+def morphology_vocabulary(jsons):
+    vocabulary = set()
+    for json_ in jsons:
+        for word in json_:
+            if not has_ud_feats(word["pos"], word.get("feats")) or needs_geox_check(word["text"], word["pos"]):
+                vocabulary.add((word["text"], word["lemma"], word["pos"]))
+    return vocabulary
+
+
+def analyse_words(keys):
+    return [get_pymorphy_tags(*key) for key in keys]
+
+
+# Пул процессов для анализа словаря создаётся один раз на число процессов и используется
+# всеми пакетами. Анализатор загружается в родительском процессе до порождения рабочих,
+# поэтому они используют его словари совместно и не загружают их сами
+vocabulary_pools = {}
+
+
+def vocabulary_pool(workers):
+    pool = vocabulary_pools.get(workers)
+    if pool is None:
+        init_morphology()
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"),
+                                   initializer=init_morphology)
+        vocabulary_pools[workers] = pool
+    return pool
+
+
+# Вместо собственного пула можно передать executor - пул, созданный вызывающим кодом
+# (например, пул, строящий деревья), с init_morphology в качестве инициализатора
+def analyse_vocabulary(jsons, workers=0, chunk_size=5000, executor=None):
+    vocabulary = morphology_vocabulary(jsons)
+    keys = [key for key in vocabulary if key not in tags_cache]
+    if len(tags_cache) + len(keys) > tags_cache_limit:
+        tags_cache.clear()
+        keys = list(vocabulary)
+    table_hits = 0
+    if morphology_table is not None or morphology_table_path:
+        missing = []
+        for key in keys:
+            tags = get_table_tags(key)
+            if tags is None:
+                missing.append(key)
+            else:
+                tags_cache[key] = tags
+        table_hits, keys = len(keys) - len(missing), missing
+    if (executor is not None or workers > 1) and len(keys) > chunk_size:
+        executor = executor or vocabulary_pool(workers)
+        chunks = [keys[ix:ix + chunk_size] for ix in range(0, len(keys), chunk_size)]
+        for chunk, tags in zip(chunks, executor.map(analyse_words, chunks)):
+            tags_cache.update(zip(chunk, tags))
+    else:
+        tags_cache.update(zip(keys, analyse_words(keys)))
+    return {
+        "tokens": sum(map(len, jsons)),
+        "vocabulary": len(vocabulary),
+        "table_hits": table_hits,
+        "analysed": len(keys)
+    }
+
+
+# Результаты анализа для слов предложения: передаются вместе с предложением в рабочий
+# процесс, который добавляет их в свой кэш функцией add_sentence_tags
+def sentence_tags(json_):
+    return {key: tags_cache[key] for key in morphology_vocabulary([json_]) if key in tags_cache}
+
+
+# Промахи в рабочем процессе редки, поэтому размер кэша проверяется и при добавлении
+# переданных результатов, иначе кэш рос бы до размера словаря всего корпуса
+def add_sentence_tags(tags):
+    if len(tags_cache) + len(tags) > tags_cache_limit:
+        tags_cache.clear()
+    tags_cache.update(tags)
+
+
+def table_key(key):
+    return "\0".join(key).encode("utf-8")
+
+
+def write_morphology_table(path, entries):
+    entries = sorted((table_key(key), tags) for key, tags in entries)
+    grammemes = sorted({tags[field] for _, tags in entries for field in _table_fields} - {None})
+    indices = {grammeme: ix + 1 for ix, grammeme in enumerate(grammemes)}
+    encoded_grammemes = json.dumps(grammemes, ensure_ascii=False).encode("utf-8")
+    offset = 0
+    with open(path, "wb") as f:
+        f.write(_table_header.pack(_table_signature, len(entries), len(encoded_grammemes)))
+        f.write(encoded_grammemes)
+        for key, _ in entries:
+            f.write(_table_offset.pack(offset))
+            offset += len(key)
+        f.write(_table_offset.pack(offset))
+        for _, tags in entries:
+            f.write(_table_record.pack(*(indices.get(tags[field], 0) for field in _table_fields),
+                                       int(tags["is_geox"])))
+        for key, _ in entries:
+            f.write(key)
+
+
+def load_morphology_table(path):
+    global morphology_table
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    signature, count, grammemes_size = _table_header.unpack_from(buffer)
+    if signature != _table_signature:
+        raise ValueError(f"{path} is not a morphology table")
+    offsets = _table_header.size + grammemes_size
+    records = offsets + (count + 1) * _table_offset.size
+    morphology_table = {
+        "path": path,
+        "buffer": buffer,
+        "count": count,
+        "grammemes": [None] + json.loads(buffer[_table_header.size:offsets].decode("utf-8")),
+        "offsets": offsets,
+        "records": records,
+        "keys": records + count * _table_record.size
+    }
+    morphology_stats["table_size"] = count
+    morphology_stats["table_hits"] = morphology_stats["table_misses"] = 0
+    return morphology_table
+
+
+def table_entry_key(table, ix):
+    start, stop = struct.unpack_from("<II", table["buffer"], table["offsets"] + ix * _table_offset.size)
+    return table["buffer"][table["keys"] + start:table["keys"] + stop]
+
+
+def get_table_tags(key):
+    if morphology_table is None:
+        if not morphology_table_path:
+            return None
+        load_morphology_table(morphology_table_path)
+    table = morphology_table
+    encoded = table_key(key)
+    low, high = 0, table["count"]
+    while low < high:
+        middle = (low + high) // 2
+        if table_entry_key(table, middle) < encoded:
+            low = middle + 1
+        else:
+            high = middle
+    if low == table["count"] or table_entry_key(table, low) != encoded:
+        morphology_stats["table_misses"] += 1
+        return None
+    morphology_stats["table_hits"] += 1
+    *values, is_geox = _table_record.unpack_from(table["buffer"], table["records"] + low * _table_record.size)
+    tags = {field: table["grammemes"][value] for field, value in zip(_table_fields, values)}
+    tags["is_geox"] = bool(is_geox)
+    return tags
+
+
+# Доля обращений к таблице, на которые ответ найден без pymorphy2
+def table_hit_rate():
+    requests = morphology_stats.get("table_hits", 0) + morphology_stats.get("table_misses", 0)
+    return morphology_stats.get("table_hits", 0) / requests if requests else None
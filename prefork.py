@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# Copyright © 2023 Anatoliy Poletaev, Ilya Paramonov, Elena Boychuk. All rights reserved.
+
+import argparse
+import gc
+import importlib
+import json
+import multiprocessing
+import os
+
+from constituency_tree_builder.creator import dependency_tree_to_constituency_tree
+from constituency_tree_builder.utils import json_to_dependency_tree
+from morph_analyzer import init_morphology, load_morphology_table, morphology_stats, morphology_table_path
+
+# Модели загружаются один раз в родительском процессе, после чего порождаются рабочие
+# процессы, которые используют страницы памяти с весами совместно (копирование при записи).
+# Родительский процесс сам не выполняет разбор: порождение процесса после запуска
+# пулов потоков torch может привести к взаимной блокировке в дочернем процессе.
+
+
+def load_models(backends):
+    os.environ["PARSER_BACKENDS"] = ",".join(backends)
+    # Модуль dependency_parsing загружает модели при импорте, поэтому он импортируется
+    # только после выбора анализаторов
+    gc.disable()
+    module = importlib.import_module("dependency_parsing")
+    init_morphology()
+    # Таблица частых слов отображается в память до порождения рабочих процессов
+    if morphology_table_path:
+        load_morphology_table(morphology_table_path)
+    gc.collect()
+    # Загруженные объекты переносятся в постоянное поколение: сборщик мусора в рабочих
+    # процессах не обходит их и не изменяет их заголовки, поэтому страницы не копируются
+    gc.freeze()
+    return module
+
+
+def serve(tasks, results, parse):
+    gc.enable()
+    pid = os.getpid()
+    for ix, sentence in iter(tasks.get, None):
+        try:
+            tree = dependency_tree_to_constituency_tree(json_to_dependency_tree(parse(sentence)))
+            results.put((ix, pid, tree, None))
+        except Exception as e:
+            results.put((ix, pid, None, repr(e)))
+
+
+def start_workers(count, parse):
+    context = multiprocessing.get_context("fork")
+    tasks, results = context.Queue(), context.Queue()
+    workers = [context.Process(target=serve, args=(tasks, results, parse), daemon=True) for _ in range(count)]
+    for worker in workers:
+        worker.start()
+    return workers, tasks, results
+
+
+def stop_workers(workers, tasks):
+    for _ in workers:
+        tasks.put(None)
+    for worker in workers:
+        worker.join()
+
+
+def memory_usage(pid):
+    # Общие страницы отображены более чем в один процесс, частные - только в этот;
+    # PSS - размер частных страниц плюс доля общих страниц, приходящаяся на процесс
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if value.strip().endswith("kB"):
+                fields[key] = int(value.split()[0])
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "shared": fields["Shared_Clean"] + fields["Shared_Dirty"],
+        "private": fields["Private_Clean"] + fields["Private_Dirty"]
+    }
+
+
+def format_memory(name, usage):
+    return f"{name}: RSS = {usage['rss'] // 1024} MB, PSS = {usage['pss'] // 1024} MB, " \
+           f"shared = {usage['shared'] // 1024} MB, private = {usage['private'] // 1024} MB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert sentences in forked worker processes sharing parser models")
+    parser.add_argument("--parser", choices=["stanza", "spacy", "natasha"], default="stanza")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--sentences", default=os.path.join("sentences", "opencorpora-sample.json"))
+    args = parser.parse_args()
+
+    module = load_models([args.parser])
+    parse = getattr(module, f"{args.parser}_json")
+    with open(args.sentences, encoding="utf-8") as f:
+        sentences = [sentence["text"] for sentence in json.load(f)]
+
+    workers, tasks, results = start_workers(args.workers, parse)
+    for ix, sentence in enumerate(sentences):
+        tasks.put((ix, sentence))
+    processed, errors = {worker.pid: 0 for worker in workers}, 0
+    for _ in sentences:
+        _, pid, _, error = results.get()
+        processed[pid] += 1
+        errors += error is not None
+    print(f"Converted {len(sentences)} sentences with {args.parser}, errors: {errors}")
+    print(f"Morphology analyzer loaded in {round(morphology_stats['load_time'], 2)} s, "
+          f"{(morphology_stats['memory'] or 0) // 2 ** 20} MB")
+
+    # Память измеряется, пока рабочие процессы ещё живы и модели в них использовались
+    print(format_memory(f"Parent {os.getpid()}", memory_usage(os.getpid())))
+    for worker in workers:
+        print(format_memory(f"Worker {worker.pid} ({processed[worker.pid]} sentences)", memory_usage(worker.pid)))
+    stop_workers(workers, tasks)
+
+
+if __name__ == "__main__":
+    main()
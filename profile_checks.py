@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# Copyright © 2023 Anatoliy Poletaev, Ilya Paramonov, Elena Boychuk. All rights reserved.
+
+import argparse
+import sys
+import time
+from functools import wraps
+from inspect import isfunction
+
+import constituency_tree_builder.checks
+import constituency_tree_builder.creator
+import constituency_tree_builder.utils
+import morph_analyzer
+from constituency_tree_builder.creator import dependency_tree_to_constituency_tree
+from constituency_tree_builder.dependency_io import read_conllu
+from constituency_tree_builder.utils import json_to_dependency_tree
+
+# Проверки и вспомогательные функции, вызовы которых учитываются. Функции вызываются по имени
+# из глобальных переменных модулей, поэтому обёртка подменяет их во всех модулях, куда они импортированы
+instrumented_modules = [constituency_tree_builder.checks, constituency_tree_builder.utils, morph_analyzer]
+patched_modules = instrumented_modules + [constituency_tree_builder.creator]
+
+
+def instrument(function, stats):
+    entry = stats.setdefault(function.__name__, {"calls": 0, "rejected": 0, "time": 0.0})
+
+    @wraps(function)
+    def run(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            entry["time"] += time.perf_counter() - start
+            entry["calls"] += 1
+        if not result:
+            entry["rejected"] += 1
+        return result
+    return run
+
+
+def install(stats):
+    wrappers = {}
+    for module in instrumented_modules:
+        for name, value in vars(module).items():
+            if isfunction(value) and value.__module__ == module.__name__ and not hasattr(value, "steps"):
+                wrappers[value] = instrument(value, stats)
+    originals = []
+    for module in patched_modules:
+        for name, value in list(vars(module).items()):
+            if isfunction(value) and value in wrappers:
+                originals.append((module, name, value))
+                setattr(module, name, wrappers[value])
+    return originals
+
+
+def uninstall(originals):
+    for module, name, value in originals:
+        setattr(module, name, value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report call counts, rejection rates and costs of the checks")
+    parser.add_argument("input", help="CoNLL-U file, - for standard input")
+    parser.add_argument("--no-feats", action="store_true", help="ignore UD features, use pymorphy2 for morphology")
+    parser.add_argument("--top", type=int, default=40)
+    args = parser.parse_args()
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    stats = {}
+    originals = install(stats)
+    sentences = errors = 0
+    start = time.perf_counter()
+    try:
+        with source:
+            for _, json_ in read_conllu(source):
+                if args.no_feats:
+                    for word in json_:
+                        del word["feats"]
+                try:
+                    dependency_tree_to_constituency_tree(json_to_dependency_tree(json_))
+                except Exception:
+                    errors += 1
+                sentences += 1
+    finally:
+        uninstall(originals)
+    total = time.perf_counter() - start
+
+    # Время включает вложенные проверки; доля отказов - доля вызовов с ложным или пустым результатом
+    print(f"{sentences} sentences, errors: {errors}, {round(total, 2)} s")
+    print(f"{'check':<50} {'calls':>9} {'rejected':>9} {'total, ms':>10} {'per call, us':>13}")
+    for name, entry in sorted(stats.items(), key=lambda x: -x[1]["time"])[:args.top]:
+        if entry["calls"] == 0:
+            continue
+        print(f"{name:<50} {entry['calls']:>9} {entry['rejected'] / entry['calls']:>9.1%} "
+              f"{entry['time'] * 1000:>10.1f} {entry['time'] / entry['calls'] * 10 ** 6:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
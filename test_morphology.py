@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# Copyright © 2023 Anatoliy Poletaev, Ilya Paramonov, Elena Boychuk. All rights reserved.
+
+import io
+
+from constituency_tree_builder.dependency_io import read_conllu
+from morph_analyzer import get_tags
+
+# Предложение с пустым столбцом FEATS у деепричастия и неполными признаками у глагола
+conllu = """# text = Он шёл, читая книгу.
+1\tОн\tон\tPRON\t_\tCase=Nom|Gender=Masc|Number=Sing|Person=3\t2\tnsubj\t_\t_
+2\tшёл\tидти\tVERB\t_\tAspect=Imp|Gender=Masc|Mood=Ind|Number=Sing|Tense=Past|VerbForm=Fin\t0\troot\t_\t_
+3\t,\t,\tPUNCT\t_\t_\t4\tpunct\t_\t_
+4\tчитая\tчитать\tVERB\t_\t_\t2\tadvcl\t_\t_
+5\tкнигу\tкнига\tNOUN\t_\tAnimacy=Inan|Number=Sing\t4\tobj\t_\t_
+6\t.\t.\tPUNCT\t_\t_\t2\tpunct\t_\t_
+
+"""
+
+
+def word_tags(word):
+    return get_tags(word["text"], word["lemma"], word["pos"], word["feats"])
+
+
+def main():
+    (_, json_), = read_conllu(io.StringIO(conllu))
+    checks = [
+        # Пустой столбец FEATS: признаков нет, они берутся из pymorphy2
+        ("empty FEATS column is read as missing", json_[3]["feats"] is None),
+        ("converb without FEATS is tagged by pymorphy2", word_tags(json_[3])["pos"] == "GRND"),
+        ("converb with empty feats is tagged by pymorphy2", get_tags("читая", "читать", "VERB", {})["pos"] == "GRND"),
+        # Признаки без падежа у существительного недостаточны
+        ("noun without Case is tagged by pymorphy2", word_tags(json_[4])["case"] == "accs"),
+        # Полные признаки UD используются как есть
+        ("finite verb is tagged from UD feats", word_tags(json_[1])["tense"] == "past"),
+        ("pronoun is tagged from UD feats", word_tags(json_[0])["person"] == "3per")
+    ]
+    failed = False
+    for name, passed in checks:
+        print(f"{name}: {'ok' if passed else 'FAILED'}")
+        failed = failed or not passed
+    exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
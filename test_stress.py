@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# Copyright © 2023 Anatoliy Poletaev, Ilya Paramonov, Elena Boychuk. All rights reserved.
+
+import sys
+import time
+from copy import deepcopy
+
+from constituency_tree_builder.creator import dependency_tree_to_constituency_tree
+from constituency_tree_builder.execution import Budget, CallCache
+from constituency_tree_builder.incremental import start_incremental_conversion, apply_dependency_edit, \
+    _cacheable_builders
+from constituency_tree_builder.utils import json_to_dependency_tree
+
+
+def token(id_, text, lemma, pos, head_id, deprel):
+    return {"id": id_, "text": text, "lemma": lemma, "pos": pos, "head_id": head_id, "deprel": deprel}
+
+
+def genitive_chain_sentence(length):
+    # Я видел дом брата друга отца соседа брата ... .
+    nouns = [("брата", "брат"), ("друга", "друг"), ("отца", "отец"), ("соседа", "сосед")]
+    json_ = [token(0, "Я", "я", "PRON", 1, "nsubj"),
+             token(1, "видел", "видеть", "VERB", -1, "root"),
+             token(2, "дом", "дом", "NOUN", 1, "obj")]
+    while len(json_) < length - 1:
+        text, lemma = nouns[len(json_) % len(nouns)]
+        json_.append(token(len(json_), text, lemma, "NOUN", len(json_) - 1, "nmod"))
+    json_.append(token(len(json_), ".", ".", "PUNCT", 1, "punct"))
+    return json_
+
+
+def genitive_chain_with_clause_sentence(length):
+    # Я видел дом брата друга отца ..., что он думает.
+    json_ = genitive_chain_sentence(length - 4)[:-1]
+    ix = len(json_)
+    json_ += [token(ix, ",", ",", "PUNCT", ix + 3, "punct"),
+              token(ix + 1, "что", "что", "SCONJ", ix + 3, "mark"),
+              token(ix + 2, "он", "он", "PRON", ix + 3, "nsubj"),
+              token(ix + 3, "думает", "думать", "VERB", 1, "ccomp"),
+              token(ix + 4, ".", ".", "PUNCT", 1, "punct")]
+    return json_
+
+
+def subordinative_chain_sentence(length):
+    # Я знаю, что он думает, что она знает, что он думает, ... .
+    subjects = [("он", "он"), ("она", "она")]
+    verbs = [("думает", "думать"), ("знает", "знать")]
+    json_ = [token(0, "Я", "я", "PRON", 1, "nsubj"),
+             token(1, "знаю", "знать", "VERB", -1, "root")]
+    main_verb = 1
+    while len(json_) + 4 < length:
+        ix = len(json_)
+        (subject, subject_lemma), (verb, verb_lemma) = subjects[ix // 4 % 2], verbs[ix // 4 % 2]
+        json_ += [token(ix, ",", ",", "PUNCT", ix + 3, "punct"),
+                  token(ix + 1, "что", "что", "SCONJ", ix + 3, "mark"),
+                  token(ix + 2, subject, subject_lemma, "PRON", ix + 3, "nsubj"),
+                  token(ix + 3, verb, verb_lemma, "VERB", main_verb, "ccomp")]
+        main_verb = ix + 3
+    json_.append(token(len(json_), ".", ".", "PUNCT", 1, "punct"))
+    return json_
+
+
+def enumeration_sentence(length):
+    # Я купил яблоко, грушу, сливу, ... и яблоко.
+    nouns = [("яблоко", "яблоко"), ("грушу", "груша"), ("сливу", "слива"), ("вишню", "вишня")]
+    json_ = [token(0, "Я", "я", "PRON", 1, "nsubj"),
+             token(1, "купил", "купить", "VERB", -1, "root"),
+             token(2, "яблоко", "яблоко", "NOUN", 1, "obj")]
+    for ix in range(1, length):
+        text, lemma = nouns[ix % len(nouns)]
+        id_ = len(json_)
+        if ix == length - 1:
+            json_.append(token(id_, "и", "и", "CCONJ", id_ + 1, "cc"))
+        else:
+            json_.append(token(id_, ",", ",", "PUNCT", id_ + 1, "punct"))
+        json_.append(token(id_ + 1, text, lemma, "NOUN", 2, "conj"))
+    json_.append(token(len(json_), ".", ".", "PUNCT", 1, "punct"))
+    return json_
+
+
+def convert(json_, iterative, group_format="keys"):
+    return dependency_tree_to_constituency_tree(json_to_dependency_tree(deepcopy(json_)), iterative=iterative,
+                                                group_format=group_format)
+
+
+def count_parts(ctree):
+    nodes, parts = [ctree], 0
+    while nodes:
+        node = nodes.pop()
+        for key, value in node.items():
+            if key == "parts":
+                parts = max(parts, len(value))
+                nodes.extend(value)
+            elif not key.startswith("_"):
+                nodes.append(value)
+    return parts
+
+
+def ancestors(json_, token_id):
+    heads = {word["id"]: word["head_id"] for word in json_}
+    result = set()
+    while token_id in heads and token_id not in result:
+        result.add(token_id)
+        token_id = heads[token_id]
+    return result
+
+
+# Число вызовов кэшируемых построителей для токенов token_ids при полном построении
+def count_builder_calls(json_, token_ids):
+    calls = 0
+
+    def lookup(function, args):
+        nonlocal calls
+        if len(args) == 1 and function in _cacheable_builders and args[0]["id"] in token_ids:
+            calls += 1
+        return None, None
+    dependency_tree_to_constituency_tree(json_to_dependency_tree(deepcopy(json_)),
+                                         cache=CallCache(lookup, lambda ticket, value: None))
+    return calls
+
+
+# Правка одного токена длинного предложения: заново строятся все вызовы для самого токена
+# и его предков (до и после правки) и только они, и правка выполняется быстрее полного построения
+def check_incremental_edit(json_, token_id, **edit):
+    state = start_incremental_conversion(json_)
+    allowed = ancestors(state["json"], token_id)
+    start = time.perf_counter()
+    report = apply_dependency_edit(state, token_id, **edit)
+    incremental_time = time.perf_counter() - start
+    allowed |= ancestors(state["json"], token_id)
+    start = time.perf_counter()
+    full = convert(state["json"], iterative=True)
+    full_time = time.perf_counter() - start
+    same = report["tree"] == full
+    only_ancestors = report["rebuilt_ids"] <= allowed
+    expected = count_builder_calls(state["json"], allowed)
+    return same and only_ancestors and report["rebuilt"] == expected and incremental_time < full_time, \
+        f"{report['rebuilt']} of {expected} ancestor calls rebuilt " \
+        f"({'only' if only_ancestors else 'NOT only'} ancestors), " \
+        f"{report['reused']} reused, {round(incremental_time, 2)} s against {round(full_time, 2)} s " \
+        f"for a full conversion{'' if same else ', trees DIFFER'}"
+
+
+def main():
+    sentences = [(genitive_chain_sentence, "Genitive chain"), (subordinative_chain_sentence, "Subordinative chain")]
+    failed = False
+    for create_sentence, name in sentences:
+        json_ = create_sentence(300)
+        recursion_limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(100000)
+        try:
+            same = convert(json_, iterative=True) == convert(json_, iterative=False)
+        finally:
+            sys.setrecursionlimit(recursion_limit)
+        print(f"{name}, 300 tokens: work-stack and recursive trees {'match' if same else 'DIFFER'}")
+        failed = failed or not same
+        json_ = create_sentence(2000)
+        start = time.perf_counter()
+        try:
+            convert(json_, iterative=True)
+            print(f"{name}, 2000 tokens: converted in {round(time.perf_counter() - start, 2)} s")
+        except RecursionError:
+            print(f"{name}, 2000 tokens: RecursionError")
+            failed = True
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(100000)
+    try:
+        for create_sentence, name in sentences + [(genitive_chain_with_clause_sentence,
+                                                   "Genitive chain with a subordinate clause")]:
+            passed, message = check_incremental_edit(create_sentence(2000), 0, deprel="obl")
+            print(f"{name}, 2000 tokens, edit of one token: {message}")
+            failed = failed or not passed
+    finally:
+        sys.setrecursionlimit(recursion_limit)
+    # Построение главной части вместе с придаточным учитывается в бюджете шагов
+    json_ = genitive_chain_with_clause_sentence(405)
+    for steps, expected in [(20, "fallback"), (100000, "sentence")]:
+        ctree = dependency_tree_to_constituency_tree(json_to_dependency_tree(deepcopy(json_)),
+                                                     budget=Budget(steps=steps))
+        print(f"Genitive chain with a subordinate clause, 405 tokens, budget of {steps} steps: {ctree['_type']}")
+        failed = failed or ctree["_type"] != expected
+    for length in [100, 1000]:
+        json_ = enumeration_sentence(length)
+        start = time.perf_counter()
+        parts = count_parts(convert(json_, iterative=True, group_format="list"))
+        print(f"Enumeration of {length} objects: converted in {round(time.perf_counter() - start, 2)} s, "
+              f"{parts} parts in the largest group")
+        failed = failed or parts != length
+    exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()